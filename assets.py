@@ -0,0 +1,40 @@
+import io
+import os
+import time
+from urllib.parse import parse_qs, urlparse
+
+import nextcord
+
+from grading import GRADES
+
+
+# Grade badges for /karma. The images are read once at startup, and once a
+# badge has been uploaded its CDN URL is reused as the thumbnail until the
+# signed URL expires, so most /karma calls send no image at all.
+class Badges:
+    def __init__(self, directory='image', ttl=43200, margin=600):
+        self.images = {}
+        for grade in GRADES:
+            with open(os.path.join(directory, f'{grade.letter}.png'), 'rb') as f:
+                self.images[grade.letter] = f.read()
+        self.ttl = ttl
+        self.margin = margin
+        self.urls = {}
+
+    def url(self, letter):
+        entry = self.urls.get(letter)
+        if entry is not None and entry[0] > time.time():
+            return entry[1]
+        return None
+
+    def file(self, letter):
+        return nextcord.File(io.BytesIO(self.images[letter]), filename='image.png')
+
+    def remember(self, letter, url):
+        # Discord signs attachment URLs with their expiry time (hex) in "ex"
+        expires = time.time() + self.ttl
+        try:
+            expires = min(expires, int(parse_qs(urlparse(url).query)['ex'][0], 16))
+        except (KeyError, ValueError):
+            pass
+        self.urls[letter] = (expires - self.margin, url)
@@ -0,0 +1,132 @@
+import configparser
+import time
+from functools import partial
+
+import redis
+
+from karma import BUCKET_WIDTH, BUCKETS, unpack, unpack_decayed
+
+CHECKPOINT = 'backfill:cursor'
+
+# Counts the ranked users per bucket of manner scores into a new hash and
+# swaps it in for the histogram. It runs as one script, so the bot's RECORD
+# updates land either before it (and are counted) or after it (and adjust the
+# new hash), never in between.
+# KEYS: manner, histogram, temporary key
+# ARGV: bucket width, bucket count
+HISTOGRAM = """
+local width = tonumber(ARGV[1])
+local last = tonumber(ARGV[2]) - 1
+redis.call('DEL', KEYS[3])
+for index = 0, last do
+    local low = index == 0 and '-inf' or tostring(index * width)
+    local high = index == last and '+inf' or '(' .. tostring((index + 1) * width)
+    redis.call('HSET', KEYS[3], index, redis.call('ZCOUNT', KEYS[1], low, high))
+end
+redis.call('RENAME', KEYS[3], KEYS[2])
+"""
+
+
+def needs_backfill(r):
+    return not r.exists('manner') or not r.exists('hist:global') or r.exists(CHECKPOINT)
+
+
+def legacy_scores(r, keys):
+    with r.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.get(key)
+            pipe.get(f'msg:{key[4:]}')
+        values = pipe.execute()
+    scores = {}
+    for key, total, count in zip(keys, values[::2], values[1::2]):
+        if total is not None and count and int(count) > 0:
+            scores[key[4:]] = 100 - float(total) / int(count)
+    return scores
+
+
+# with decayed, users that have a decay:{n} field are ranked by it instead
+def compact_scores(r, keys, decayed=False):
+    with r.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.hgetall(key)
+            if decayed:
+                pipe.hgetall(f'decay:{key[6:]}')
+        values = pipe.execute()
+    if not decayed:
+        values = [(fields, {}) for fields in values]
+    else:
+        values = zip(values[::2], values[1::2])
+    scores = {}
+    for fields, states in values:
+        for user_id, value in fields.items():
+            total, count = unpack(value)
+            if user_id in states:
+                total, weight, updated = unpack_decayed(states[user_id])
+                scores[user_id] = 100 - total / weight
+            elif count > 0:
+                scores[user_id] = 100 - total / count
+    return scores
+
+
+def phases(decayed=False):
+    return {'val:*': legacy_scores, 'karma:*': partial(compact_scores, decayed=decayed)}
+
+
+# Rebuilds the manner ranking and the global histogram from the stored totals,
+# both the legacy val:/msg: keys and the compact karma:{n} hashes. The
+# histogram is counted from the finished ranking, where every user is in
+# exactly once however often SCAN returned their key.
+# Walks the keyspace with SCAN instead of KEYS so the server is never blocked,
+# reads and writes each batch through pipelines and stores the SCAN position in
+# the same transaction as the ZADD, so a crash resumes where it stopped.
+# decayed ranks by the decayed scores (KarmaStore with a half life).
+def backfill(r, batch=1000, decayed=False):
+    checkpoint = r.get(CHECKPOINT)
+    if checkpoint:
+        phase, cursor = checkpoint.split(' ')
+        cursor = int(cursor)
+        print(f'Resuming ranking backfill from {phase} cursor {cursor}...')
+    else:
+        phase, cursor = 'val:*', 0
+        print('Adding all users to the ranking...')
+
+    scorers = phases(decayed)
+    patterns = list(scorers)
+    users = 0
+    start = last_report = time.perf_counter()
+    while True:
+        cursor, keys = r.scan(cursor, match=phase, count=batch)
+        scores = scorers[phase](r, keys) if keys else {}
+        if cursor == 0 and phase != patterns[-1]:
+            phase = patterns[patterns.index(phase) + 1]
+            finished = False
+        else:
+            finished = cursor == 0
+
+        with r.pipeline() as pipe:
+            if scores:
+                pipe.zadd('manner', scores)
+            if not finished:
+                pipe.set(CHECKPOINT, f'{phase} {cursor}')
+            pipe.execute()
+        users += len(scores)
+        if finished:
+            r.register_script(HISTOGRAM)(keys=['manner', 'hist:global', 'hist:global:rebuild'],
+                                         args=[BUCKET_WIDTH, BUCKETS])
+            r.delete(CHECKPOINT)
+
+        now = time.perf_counter()
+        if finished or now - last_report >= 1:
+            last_report = now
+            elapsed = now - start
+            print(f'Ranked {users} users in {elapsed:.1f}s ({users / max(elapsed, 1e-9):.0f} users/s)')
+        if finished:
+            return users
+
+
+if __name__ == '__main__':
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    r = redis.Redis(host=config['REDIS']['host'], port=config['REDIS']['port'], password=config['REDIS']['password'],
+                    decode_responses=True, db=config['REDIS']['db'])
+    backfill(r, decayed=config['KARMA'].getfloat('half_life', 0) > 0)
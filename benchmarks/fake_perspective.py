@@ -0,0 +1,126 @@
+# A local stand-in for the commentanalyzer API. It answers comments:analyze
+# and batch requests with a deterministic toxicity for each text, and can add
+# latency, random errors and a QPS quota (answered with 429 like the real API).
+# usage: python benchmarks/fake_perspective.py [port] [latency ms] [error rate] [qps]
+import json
+import random
+import re
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TOXIC = ('idiot', 'stupid', 'hate', 'moron', 'shut up', 'loser', 'trash')
+
+
+def toxicity(text):
+    lowered = text.lower()
+    score = (zlib.crc32(lowered.encode()) % 1000 / 1000) ** 4 * 0.4
+    score += 0.3 * sum(word in lowered for word in TOXIC)
+    return min(score, 0.99)
+
+
+def analyze(body):
+    text = json.loads(body)['comment']['text']
+    return {'attributeScores': {'TOXICITY': {'summaryScore': {'value': toxicity(text), 'type': 'PROBABILITY'}}},
+            'languages': ['en'], 'detectedLanguages': ['en']}
+
+
+class FakePerspective(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.05, jitter=0.02, error_rate=0.0, qps=0):
+        super().__init__(('127.0.0.1', port), Handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.qps = qps
+        self.lock = threading.Lock()
+        self.window = int(time.time())
+        self.used = 0
+        self.requests = 0
+        self.calls = 0
+        self.errors = 0
+        self.throttled = 0
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}/'
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    # returns the HTTP status for one scored comment
+    def admit(self):
+        with self.lock:
+            self.calls += 1
+            now = int(time.time())
+            if now != self.window:
+                self.window, self.used = now, 0
+            if self.qps and self.used >= self.qps:
+                self.throttled += 1
+                return 429
+            self.used += 1
+            if random.random() < self.error_rate:
+                self.errors += 1
+                return 503
+        return 200
+
+    def stats(self):
+        return {'requests': self.requests, 'calls': self.calls, 'errors': self.errors, 'throttled': self.throttled}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def respond(self, status, content_type, payload):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with server.lock:
+            server.requests += 1
+        time.sleep(max(0.0, server.latency + random.uniform(-server.jitter, server.jitter)))
+
+        if self.path.startswith('/batch'):
+            self.batch(body)
+        elif 'comments:analyze' in self.path:
+            status = server.admit()
+            payload = analyze(body) if status == 200 else {'error': {'code': status, 'message': 'fake error'}}
+            self.respond(status, 'application/json', json.dumps(payload).encode())
+        else:
+            self.respond(404, 'application/json', b'{}')
+
+    def batch(self, body):
+        boundary = re.search(r'boundary="?([^";]+)"?', self.headers['Content-Type']).group(1)
+        parts = []
+        for part in body.decode().split(f'--{boundary}')[1:-1]:
+            content_id = re.search(r'Content-ID: <([^>]+)>', part).group(1)
+            request = part.split('\r\n\r\n', 1)[1] if '\r\n\r\n' in part else part.split('\n\n', 1)[1]
+            request_body = request.split('\r\n\r\n', 1)[1] if '\r\n\r\n' in request else request.split('\n\n', 1)[1]
+            status = self.server.admit()
+            payload = analyze(request_body.strip()) if status == 200 else {'error': {'code': status}}
+            reason = {200: 'OK', 429: 'Too Many Requests', 503: 'Service Unavailable'}[status]
+            parts.append(f'--batch_fake\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n'
+                         f'HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n\r\n{json.dumps(payload)}\r\n')
+        self.respond(200, 'multipart/mixed; boundary=batch_fake', (''.join(parts) + '--batch_fake--\r\n').encode())
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8089
+    server = FakePerspective(port,
+                             latency=float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.05,
+                             error_rate=float(sys.argv[3]) if len(sys.argv) > 3 else 0.0,
+                             qps=int(sys.argv[4]) if len(sys.argv) > 4 else 0)
+    print(f'Fake Perspective API listening on {server.url}')
+    server.serve_forever()
@@ -0,0 +1,276 @@
+# Load test for the real on_message, /karma and evaluate message handlers.
+# main.py is imported against a local fake Perspective server
+# (fake_perspective.py), stand-in Discord objects and a local Redis or
+# fakeredis, then driven with a synthetic or recorded trace of events.
+# Reports throughput, handler latency percentiles, and Redis round trips and
+# API calls per message.
+#
+# usage: python benchmarks/loadtest.py [--count 2000] [--rate 200] [--fakeredis]
+#                                      [--record trace.jsonl | --replay trace.jsonl]
+import argparse
+import asyncio
+import configparser
+import datetime
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_perspective import FakePerspective  # noqa: E402
+
+WORDS = ('hello', 'gg', 'lol', 'nice', 'game', 'thanks', 'what', 'are', 'you', 'doing', 'tonight', 'see', 'ya',
+         'that', 'was', 'great', 'idiot', 'stupid', 'shut up', 'loser', 'the', 'map', 'is', 'trash', 'ok')
+COPYPASTA = ('gg', 'lol', '😂😂😂', 'first', 'shut up loser', 'https://example.com/raid')
+
+
+def generate(count, rate, users=500, guilds=20, seed=1):
+    random.seed(seed)
+    events = []
+    t = 0.0
+    for i in range(count):
+        t += random.expovariate(rate)
+        roll = random.random()
+        kind = 'message' if roll < 0.95 else 'karma' if roll < 0.99 else 'evaluate'
+        if random.random() < 0.2:
+            content = random.choice(COPYPASTA)
+        else:
+            content = ' '.join(random.choice(WORDS) for _ in range(random.randint(1, 12)))
+        guild = random.randrange(guilds)
+        events.append({'t': round(t, 4), 'kind': kind, 'guild': 900000 + guild, 'channel': 800000 + guild,
+                       'author': 700000 + random.randrange(users), 'message': 600000 + i, 'content': content})
+    return events
+
+
+class Channel:
+    def __init__(self, id):
+        self.id = id
+        self.mention = f'<#{id}>'
+        self.sent = 0
+        self.deleted = 0
+
+    async def send(self, content=None, **kwargs):
+        self.sent += 1
+
+    async def delete_messages(self, messages, **kwargs):
+        self.deleted += len(messages)
+
+
+class User:
+    def __init__(self, id):
+        self.id = id
+        self.mention = f'<@{id}>'
+        self.display_name = f'user{id}'
+        self.avatar = None
+        self.bot = False
+        self.created_at = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+class Message:
+    def __init__(self, event, guild, channel):
+        self.id = event['message']
+        self.content = event['content']
+        self.author = User(event['author'])
+        self.guild = guild
+        self.channel = channel
+        self.created_at = datetime.datetime.now(datetime.timezone.utc)
+        self.deleted = False
+        self.reactions = []
+
+    async def delete(self, **kwargs):
+        self.deleted = True
+
+    async def add_reaction(self, emoji):
+        self.reactions.append(emoji)
+
+
+class Response:
+    async def send_message(self, *args, **kwargs):
+        pass
+
+
+class Interaction:
+    def __init__(self, user, guild):
+        self.user = user
+        self.guild = guild
+        self.locale = 'en-US'
+        self.response = Response()
+
+    async def original_message(self):
+        return SimpleNamespace(embeds=[])
+
+
+def count_round_trips(counter):
+    from redis.asyncio.client import Pipeline, Redis
+
+    execute_command = Redis.execute_command
+    execute = Pipeline.execute
+
+    async def counted_command(self, *args, **kwargs):
+        counter[0] += 1
+        return await execute_command(self, *args, **kwargs)
+
+    async def counted_execute(self, *args, **kwargs):
+        counter[0] += 1
+        return await execute(self, *args, **kwargs)
+
+    Redis.execute_command = counted_command
+    Pipeline.execute = counted_execute
+
+
+def use_fakeredis():
+    import fakeredis
+    import redis
+    import redis.asyncio
+
+    server = fakeredis.FakeServer()
+    redis.Redis = lambda *args, **kwargs: fakeredis.FakeRedis(server=server, decode_responses=True)
+    redis.asyncio.ConnectionPool = lambda *args, **kwargs: None
+    redis.asyncio.Redis = lambda *args, **kwargs: fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+
+
+def load_main(perspective, args):
+    config = configparser.ConfigParser()
+    config.read(os.path.join(ROOT, 'config.ini'))
+    config['CREDENTIALS']['token'] = 'load-test'
+    config['GOOGLE']['api_key'] = 'load-test'
+    config['GOOGLE']['root_url'] = perspective.url
+    config['GOOGLE']['qps'] = str(args.qps)
+    config['GOOGLE']['burst'] = str(max(1, int(args.qps)))
+    if args.redis_db is not None:
+        config['REDIS']['db'] = str(args.redis_db)
+    path = os.path.join(tempfile.mkdtemp(), 'config.ini')
+    with open(path, 'w') as f:
+        config.write(f)
+
+    os.environ['CHAT_KARMA_CONFIG'] = path
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    import main
+    return main
+
+
+def percentile(samples, q):
+    if not samples:
+        return 0.0
+    return statistics.quantiles(samples, n=100, method='inclusive')[q - 1] if len(samples) > 1 else samples[0]
+
+
+async def drive(main, events, speed):
+    guilds = {}
+    channels = {}
+    latencies = {'message': [], 'karma': [], 'evaluate': []}
+    errors = {}
+
+    for event in events:
+        if event['guild'] not in guilds:
+            log = Channel(event['guild'] + 1)
+            channels[log.id] = log
+            guilds[event['guild']] = SimpleNamespace(id=event['guild'], name=f"guild{event['guild']}", me=None)
+            # half of the guilds are strict and log their deletions
+            if event['guild'] % 2 == 0:
+                await main.guild_settings.set(event['guild'], 'del', '40')
+                await main.guild_settings.set(event['guild'], 'log', str(log.id))
+        channels.setdefault(event['channel'], Channel(event['channel']))
+    main.client.get_channel = channels.get
+
+    async def run(event):
+        guild = guilds[event['guild']]
+        channel = channels[event['channel']]
+        start = time.perf_counter()
+        try:
+            if event['kind'] == 'message':
+                await main.on_message(Message(event, guild, channel))
+            elif event['kind'] == 'karma':
+                await main.karma.callback(Interaction(User(event['author']), guild), None)
+            else:
+                await main.evaluate_message.callback(Interaction(User(event['author']), guild),
+                                                     Message(event, guild, channel))
+        except Exception as e:
+            errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+        latencies[event['kind']].append(time.perf_counter() - start)
+
+    tasks = []
+    start = time.perf_counter()
+    for event in events:
+        delay = event['t'] / speed - (time.perf_counter() - start)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(run(event)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    # let the buffered log entries and rate limited notices go out before counting them
+    if hasattr(main, 'log_dispatcher'):
+        await main.log_dispatcher.flush_all()
+        await asyncio.gather(*main.notices.tasks)
+    return elapsed, latencies, errors, channels
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the chat-karma handlers.')
+    parser.add_argument('--count', type=int, default=2000, help='number of synthetic events')
+    parser.add_argument('--rate', type=float, default=200, help='synthetic events per second')
+    parser.add_argument('--speed', type=float, default=1.0, help='replay speed multiplier')
+    parser.add_argument('--record', help='write the synthetic trace to this file')
+    parser.add_argument('--replay', help='replay a recorded trace instead of generating one')
+    parser.add_argument('--latency', type=float, default=50, help='fake API latency in ms')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fake API error rate')
+    parser.add_argument('--quota', type=int, default=0, help='fake API QPS quota (0 for none)')
+    parser.add_argument('--qps', type=float, default=100, help='QPS the bot is configured to use')
+    parser.add_argument('--fakeredis', action='store_true', help='use fakeredis instead of the configured Redis')
+    parser.add_argument('--redis-db', type=int, help='Redis database to use (it will be written to)')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    if args.replay:
+        with open(args.replay) as f:
+            events = [json.loads(line) for line in f if line.strip()]
+    else:
+        events = generate(args.count, args.rate)
+        if args.record:
+            with open(args.record, 'w') as f:
+                f.writelines(json.dumps(event) + '\n' for event in events)
+
+    perspective = FakePerspective(latency=args.latency / 1000, error_rate=args.error_rate, qps=args.quota).start()
+    if args.fakeredis:
+        use_fakeredis()
+    round_trips = [0]
+    count_round_trips(round_trips)
+    bot = load_main(perspective, args)
+
+    async def run():
+        before = round_trips[0]
+        result = await drive(bot, events, args.speed)
+        await bot.scorer.stop()
+        return result + (round_trips[0] - before,)
+
+    elapsed, latencies, errors, channels, trips = asyncio.new_event_loop().run_until_complete(run())
+
+    messages = len(latencies['message'])
+    results = {
+        'events': len(events),
+        'seconds': round(elapsed, 3),
+        'messages_per_second': round(messages / elapsed, 1),
+        'latency_ms': {kind: {f'p{q}': round(percentile(samples, q) * 1000, 2) for q in (50, 95, 99)}
+                       for kind, samples in latencies.items() if samples},
+        'redis_round_trips_per_event': round(trips / len(events), 2),
+        'api_calls_per_message': round(perspective.calls / max(messages, 1), 3),
+        'api': perspective.stats(),
+        'log_sends': sum(channel.sent for channel in channels.values()),
+        'scheduler': bot.scheduler.stats(),
+        'errors': errors,
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
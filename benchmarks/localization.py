@@ -0,0 +1,55 @@
+# Per message cost of rendering the deletion notice and the log entry, with
+# the raw ConfigParser lookups and freshly built embeds versus the compiled
+# catalog and the cached embed skeletons.
+# usage: python benchmarks/localization.py [iterations]
+import configparser
+import os
+import sys
+import timeit
+from types import SimpleNamespace
+
+import nextcord
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import embeds  # noqa: E402
+from localization import Catalog  # noqa: E402
+
+author = SimpleNamespace(id=1036928006930841610, mention='<@1036928006930841610>',
+                         avatar='https://cdn.discordapp.com/embed/avatars/0.png')
+message = SimpleNamespace(id=1100000000000000000, content='some message that got deleted', author=author,
+                          channel=SimpleNamespace(mention='<#1036928006930841611>'))
+evaluation = 87.12
+
+parser = configparser.ConfigParser()
+parser.read(os.path.join(ROOT, 'language', 'en_us.ini'), encoding='utf-8')
+catalog = Catalog(os.path.join(ROOT, 'language'))
+lang = catalog.get('en-US')
+
+
+def configparser_render():
+    embed = nextcord.Embed(title='', description=parser['DELETION']['description'].format(evaluation),
+                           color=nextcord.Color.red())
+    embed.set_author(name=parser['DELETION']['title'], icon_url=message.author.avatar)
+    embed.set_footer(text=parser['DELETION']['footer'])
+    embed.to_dict()
+    embed = nextcord.Embed(title='', description=message.content, colour=nextcord.Color.red())
+    embed.set_author(name=parser['LOG']['title'], icon_url=message.author.avatar)
+    embed.add_field(name=parser['LOG']['user'], value=message.author.mention)
+    embed.add_field(name=parser['LOG']['channel'], value=message.channel.mention)
+    embed.add_field(name=parser['LOG']['negativity'], value=f'`{evaluation}%`')
+    embed.set_footer(text=parser['LOG']['footer'].format(message.author.id, message.id))
+    embed.to_dict()
+
+
+def catalog_render():
+    embeds.deletion(catalog.get('en-US'), evaluation, message.author.avatar).to_dict()
+    embeds.log(catalog.get('en-US'), message, evaluation).to_dict()
+
+
+if __name__ == '__main__':
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    for name, render in (('configparser', configparser_render), ('catalog', catalog_render)):
+        seconds = min(timeit.repeat(render, number=iterations, repeat=5))
+        print(f'{name:>12}: {seconds / iterations * 1e6:.2f}us per message')
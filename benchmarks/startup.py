@@ -0,0 +1,42 @@
+# Measures how long the bot takes from process start to on_ready.
+# Starts main.py (with the config.ini in the repository root) several times,
+# timestamps every startup line it prints and stops it once it has logged in.
+# usage: python benchmarks/startup.py [runs]
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MILESTONES = ['Connected to redis.', 'Logged in as']
+
+
+def run_once(timeout=120):
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-u', 'main.py'], cwd=ROOT, stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT, text=True)
+    times = {}
+    try:
+        for line in process.stdout:
+            for milestone in MILESTONES:
+                if line.startswith(milestone) and milestone not in times:
+                    times[milestone] = time.perf_counter() - start
+            if 'Logged in as' in times or time.perf_counter() - start > timeout:
+                break
+    finally:
+        process.kill()
+        process.wait()
+    return times
+
+
+if __name__ == '__main__':
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    results = [run_once() for _ in range(runs)]
+    for milestone in MILESTONES:
+        samples = [result[milestone] for result in results if milestone in result]
+        if samples:
+            print(f'{milestone!r:>24}: median {statistics.median(samples):.2f}s, '
+                  f'min {min(samples):.2f}s, max {max(samples):.2f}s ({len(samples)}/{runs} runs)')
+        else:
+            print(f'{milestone!r:>24}: never reached')
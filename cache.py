@@ -0,0 +1,63 @@
+import hashlib
+import json
+from collections import OrderedDict
+
+import metrics
+
+
+def normalize(text):
+    return ' '.join(text.split()).casefold()
+
+
+def text_key(text):
+    return hashlib.blake2b(normalize(text).encode(), digest_size=16).hexdigest()
+
+
+# Two tier cache for evaluation results keyed by a hash of the normalized text.
+# The first tier is a bounded LRU in this process, the second is shared through
+# Redis so every bot process benefits from the others' API calls.
+class ToxicityCache:
+    def __init__(self, redis=None, size=10000, ttl=86400, prefix='tox:'):
+        self.redis = redis
+        self.size = size
+        self.ttl = ttl
+        self.prefix = prefix
+        self.entries = OrderedDict()
+
+    def remember(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+            metrics.cache.inc('eviction')
+
+    async def get(self, text):
+        key = text_key(text)
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+            metrics.cache.inc('hit')
+            return value
+
+        if self.redis is not None:
+            try:
+                raw = await self.redis.get(self.prefix + key)
+            except Exception:
+                raw = None
+            if raw is not None:
+                value = json.loads(raw)
+                self.remember(key, value)
+                metrics.cache.inc('redis_hit')
+                return value
+
+        metrics.cache.inc('miss')
+        return None
+
+    async def set(self, text, value):
+        key = text_key(text)
+        self.remember(key, value)
+        if self.redis is not None:
+            try:
+                await self.redis.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+            except Exception:
+                pass
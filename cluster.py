@@ -0,0 +1,125 @@
+import asyncio
+import configparser
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+import redis
+
+from backfill import backfill, needs_backfill
+
+HEALTH_TTL = 60
+
+
+# Shards given to this process by the launcher, or None when running alone.
+def shard_env():
+    if 'CHAT_KARMA_SHARD_IDS' not in os.environ:
+        return None
+    return ([int(shard) for shard in os.environ['CHAT_KARMA_SHARD_IDS'].split(',')],
+            int(os.environ['CHAT_KARMA_SHARD_COUNT']),
+            int(os.environ['CHAT_KARMA_WORKER']))
+
+
+# Written by every worker so the launcher (or anyone with redis-cli) can see
+# each shard's state. The keys expire if a worker stops reporting.
+async def heartbeat(client, r, worker, interval=15):
+    while True:
+        now = time.time()
+        shards = getattr(client, 'shards', None) or {0: None}
+        try:
+            async with r.pipeline(transaction=False) as pipe:
+                for shard_id, shard in shards.items():
+                    latency = shard.latency if shard is not None else client.latency
+                    pipe.hset(f'health:{shard_id}', mapping={
+                        'worker': worker, 'pid': os.getpid(), 'updated': now,
+                        'latency': round(latency * 1000) if math.isfinite(latency) else -1,
+                        'closed': int(shard.is_closed()) if shard is not None else int(client.is_closed()),
+                        'guilds': sum(1 for guild in client.guilds if guild.shard_id == shard_id),
+                    })
+                    pipe.expire(f'health:{shard_id}', HEALTH_TTL)
+                await pipe.execute()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f'Error: Could not report shard health ({e}), retrying...')
+            await asyncio.sleep(1)
+            continue
+        await asyncio.sleep(interval)
+
+
+def recommended_shards(token):
+    request = urllib.request.Request('https://discord.com/api/v10/gateway/bot',
+                                     headers={'Authorization': f'Bot {token}', 'User-Agent': 'chat-karma'})
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.load(response)['shards']
+
+
+def print_health(r, shard_count):
+    print('======================================')
+    for shard_id in range(shard_count):
+        health = r.hgetall(f'health:{shard_id}')
+        if not health:
+            print(f'Shard {shard_id}: no report')
+            continue
+        age = time.time() - float(health['updated'])
+        state = 'closed' if health['closed'] == '1' else 'stale' if age > HEALTH_TTL / 2 else 'ok'
+        print(f"Shard {shard_id}: {state}, worker {health['worker']} (pid {health['pid']}), "
+              f"{health['guilds']} guilds, {health['latency']}ms, reported {age:.0f}s ago")
+    print('======================================')
+
+
+# Starts one bot process per worker, each owning a contiguous range of shards,
+# restarts any that exit and prints the shard health reports.
+def launch(config, processes, shard_count):
+    host = config['REDIS']
+    r = redis.Redis(host=host['host'], port=host['port'], password=host['password'], decode_responses=True, db=host['db'])
+    if needs_backfill(r):
+        backfill(r, decayed=config['KARMA'].getfloat('half_life', 0) > 0)
+
+    size = -(-shard_count // processes)
+    ranges = [list(range(first, min(first + size, shard_count))) for first in range(0, shard_count, size)]
+    workers = {}
+
+    def start(worker):
+        env = dict(os.environ, CHAT_KARMA_SHARD_IDS=','.join(map(str, ranges[worker])),
+                   CHAT_KARMA_SHARD_COUNT=str(shard_count), CHAT_KARMA_WORKER=str(worker))
+        workers[worker] = (subprocess.Popen([sys.executable, 'main.py'], env=env), time.time())
+        print(f'Started worker {worker} for shards {ranges[worker]} (pid {workers[worker][0].pid})')
+
+    for worker in range(len(ranges)):
+        start(worker)
+        # Discord allows one identify every 5 seconds per bot
+        time.sleep(5 * len(ranges[worker]))
+
+    last_report = time.time()
+    try:
+        while True:
+            time.sleep(1)
+            for worker, (process, started) in list(workers.items()):
+                if process.poll() is not None:
+                    print(f'Worker {worker} exited with code {process.returncode}, restarting...')
+                    # back off if it keeps crashing right after starting
+                    if time.time() - started < 30:
+                        time.sleep(10)
+                    start(worker)
+            if time.time() - last_report >= config['SHARDING'].getint('report_interval', 60):
+                last_report = time.time()
+                print_health(r, shard_count)
+    except KeyboardInterrupt:
+        for process, started in workers.values():
+            process.terminate()
+        for process, started in workers.values():
+            process.wait()
+
+
+if __name__ == '__main__':
+    config = configparser.ConfigParser()
+    config.read(os.environ.get('CHAT_KARMA_CONFIG', 'config.ini'))
+    processes = config['SHARDING'].getint('processes', os.cpu_count() or 1)
+    shard_count = config['SHARDING'].getint('shards', 0) or recommended_shards(config['CREDENTIALS']['token'])
+    print(f'Launching {processes} workers for {shard_count} shards...')
+    launch(config, processes, shard_count)
@@ -0,0 +1,68 @@
+import configparser
+import time
+
+import redis
+
+from karma import MIGRATE, decay_key, unpack, user_key
+
+
+# Gives every user a decay:{n} field for the decayed karma mode, starting
+# from their lifetime mean with at most cap messages worth of weight, which
+# is what the bot does on a user's first message otherwise. The mean is
+# unchanged, so the manner ranking and the histograms stay valid. Users that
+# already have a field (the bot ran with the mode on) are left alone, so it
+# is safe to run while the bot keeps recording messages.
+def convert(r, cap=100, batch=500, pause=0.01):
+    # the legacy val:/msg: keys are moved into karma:{n} first
+    script = r.register_script(MIGRATE)
+    cursor = 0
+    while True:
+        cursor, keys = r.scan(cursor, match='val:*', count=batch)
+        if keys:
+            with r.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    user_id = key[4:]
+                    script(keys=[user_key(user_id), key, f'msg:{user_id}'], args=[user_id], client=pipe)
+                pipe.execute()
+        if cursor == 0:
+            break
+
+    users = 0
+    cursor = 0
+    start = last_report = time.perf_counter()
+    while True:
+        cursor, keys = r.scan(cursor, match='karma:*', count=batch)
+        if keys:
+            with r.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.hgetall(key)
+                pipe.time()
+                *values, (seconds, microseconds) = pipe.execute()
+            now = seconds + microseconds / 1000000
+            with r.pipeline(transaction=False) as pipe:
+                for fields in values:
+                    for user_id, value in fields.items():
+                        total, count = unpack(value)
+                        if count > 0:
+                            weight = min(count, cap)
+                            pipe.hsetnx(decay_key(user_id), user_id, f'{total / count * weight}:{weight}:{now}')
+                            users += 1
+                pipe.execute()
+
+        now = time.perf_counter()
+        if cursor == 0 or now - last_report >= 1:
+            last_report = now
+            elapsed = now - start
+            print(f'Converted {users} users in {elapsed:.1f}s ({users / max(elapsed, 1e-9):.0f} users/s)')
+        if cursor == 0:
+            break
+        time.sleep(pause)
+    return users
+
+
+if __name__ == '__main__':
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    r = redis.Redis(host=config['REDIS']['host'], port=config['REDIS']['port'], password=config['REDIS']['password'],
+                    decode_responses=True, db=config['REDIS']['db'])
+    convert(r, cap=config['KARMA'].getint('cap', 100))
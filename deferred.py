@@ -0,0 +1,119 @@
+import asyncio
+import time
+
+from redis.exceptions import ResponseError
+
+import metrics
+from scoring import Unavailable
+
+
+# Messages that could not be scored while the Perspective API was down are
+# kept in a Redis stream, so they survive a restart, and scored by consume()
+# once the circuit is no longer open. An entry is only acknowledged after it
+# was handled: entries of a worker that stopped halfway are read again when
+# it comes back, or claimed by another worker after claim_after seconds.
+class DeferredScoring:
+    def __init__(self, redis, breaker, stream='deferred:score', group='scorers', consumer='main', max_length=100000,
+                 batch=16, claim_after=300):
+        self.redis = redis
+        self.breaker = breaker
+        self.stream = stream
+        self.group = group
+        self.consumer = consumer
+        self.max_length = max_length
+        self.batch = batch
+        self.claim_after = claim_after
+        self.pending = []
+        self.flushing = None
+        self.task = None
+
+    # buffered, so an outage that fails a burst of messages at once costs one round trip
+    def add(self, message):
+        self.pending.append({'guild': message.guild.id, 'channel': message.channel.id, 'message': message.id,
+                             'author': message.author.id, 'content': message.content,
+                             'created': message.created_at.timestamp()})
+        metrics.deferred.inc('queued')
+        if self.flushing is None or self.flushing.done():
+            self.flushing = asyncio.get_running_loop().create_task(self.flush())
+
+    async def flush(self):
+        while self.pending:
+            entries, self.pending = self.pending, []
+            try:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    for fields in entries:
+                        pipe.xadd(self.stream, fields, maxlen=self.max_length, approximate=True)
+                    await pipe.execute()
+            except Exception as e:
+                print(f'Error: Could not keep {len(entries)} messages for deferred scoring ({e})')
+
+    async def create_group(self):
+        try:
+            await self.redis.xgroup_create(self.stream, self.group, id='0', mkstream=True)
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    # True when the entry is done with, False when it has to be scored again later
+    async def process(self, handle, entry_id, fields):
+        try:
+            await handle(fields)
+        except Unavailable:
+            return False
+        except Exception as e:
+            print(f"Error: Could not handle deferred message {fields.get('message')} ({e})")
+            metrics.deferred.inc('failed')
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.xack(self.stream, self.group, entry_id)
+            pipe.xdel(self.stream, entry_id)
+            await pipe.execute()
+        return True
+
+    def start(self, handle, ready=lambda: True):
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self.consume(handle, ready))
+
+    # Calls handle(fields) for every entry while the circuit is not open and
+    # ready() is true (e.g. the live traffic leaves room in the quota). Keeps
+    # going through Redis errors, starting over from the pending entries.
+    async def consume(self, handle, ready=lambda: True):
+        while True:
+            try:
+                await self.read(handle, ready)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f'Error: Lost the deferred scoring stream ({e}), retrying...')
+                await asyncio.sleep(1)
+
+    async def read(self, handle, ready):
+        await self.create_group()
+        # our own entries left pending by the last run first
+        last = '0'
+        claimed = time.monotonic()
+        while True:
+            if self.breaker.state == 'open' or not ready():
+                await asyncio.sleep(1)
+                continue
+            if last == '>' and time.monotonic() - claimed > self.claim_after:
+                claimed = time.monotonic()
+                result = await self.redis.xautoclaim(self.stream, self.group, self.consumer,
+                                                     self.claim_after * 1000, count=self.batch)
+                if result[1]:
+                    last = '0'
+            response = await self.redis.xreadgroup(self.group, self.consumer, {self.stream: last}, count=self.batch,
+                                                   block=5000 if last == '>' else None)
+            entries = response[0][1] if response else []
+            # trimmed by max_length while pending
+            gone = [entry_id for entry_id, fields in entries if not fields]
+            if gone:
+                await self.redis.xack(self.stream, self.group, *gone)
+            entries = [(entry_id, fields) for entry_id, fields in entries if fields]
+            if not entries:
+                last = '>'
+                continue
+            done = await asyncio.gather(*(self.process(handle, entry_id, fields) for entry_id, fields in entries))
+            if not all(done):
+                # the API went down again, read the pending entries once it is back
+                last = '0'
+                await asyncio.sleep(1)
@@ -0,0 +1,48 @@
+import asyncio
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from karma import BUCKET_WIDTH
+
+
+# Draws the histogram without pyplot, so no global figure state is touched
+# and the non-interactive Agg canvas is used. matplotlib is only imported the
+# first time a histogram is drawn to keep it out of the bot's startup.
+def render(histogram):
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(5, 3))
+    ax = fig.subplots()
+    ax.bar([i * BUCKET_WIDTH for i in range(len(histogram))], histogram, width=BUCKET_WIDTH, align='edge')
+    ax.set_xlabel('Karma score')
+    ax.set_ylabel('Number of members')
+    fig.tight_layout()
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png')
+    return buffer.getvalue()
+
+
+# Rendered histogram images per guild (None for everyone), kept for ttl
+# seconds. Concurrent requests for the same guild share one rendering.
+class DistributionCache:
+    def __init__(self, karma_store, ttl=60):
+        self.karma_store = karma_store
+        self.ttl = ttl
+        self.entries = {}
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='distribution')
+
+    async def image(self, guild_id=None):
+        entry = self.entries.get(guild_id)
+        if entry is None or entry[0] < time.monotonic():
+            entry = (time.monotonic() + self.ttl, asyncio.ensure_future(self.render(guild_id)))
+            self.entries[guild_id] = entry
+        try:
+            return await asyncio.shield(entry[1])
+        except Exception:
+            self.entries.pop(guild_id, None)
+            raise
+
+    async def render(self, guild_id):
+        histogram = await self.karma_store.histogram(guild_id)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, render, histogram)
@@ -0,0 +1,81 @@
+import nextcord
+
+# Static parts of the embeds the bot sends most often, built once per locale.
+# Handlers only fill in the per message values, and fully static embeds are
+# reused as they are.
+skeletons = {}
+
+
+def skeleton(lang, name):
+    data = skeletons.get((lang.name, name))
+    if data is None:
+        data = skeletons[lang.name, name] = BUILDERS[name](lang)
+    return data
+
+
+def author(name, icon_url):
+    if icon_url is None:
+        return {'name': name}
+    return {'name': name, 'icon_url': str(icon_url)}
+
+
+def field(name, value, inline=True):
+    return {'name': name, 'value': value, 'inline': inline}
+
+
+def build_deletion(lang):
+    return {'type': 'rich', 'color': nextcord.Color.red().value, 'footer': {'text': lang['DELETION']['footer']}}
+
+
+def build_log(lang):
+    return {'type': 'rich', 'color': nextcord.Color.red().value,
+            'names': (lang['LOG']['user'], lang['LOG']['channel'], lang['LOG']['negativity'])}
+
+
+def build_dashboard(lang):
+    return {'type': 'rich', 'color': nextcord.Color.green().value,
+            'description': lang['DASHBOARD']['embed.description'],
+            'footer': {'text': lang['DASHBOARD']['embed.footer']},
+            'names': (lang['DASHBOARD']['embed.delete'], lang['DASHBOARD']['embed.reaction'], lang['DASHBOARD']['embed.log'])}
+
+
+def build_help(lang):
+    embed = nextcord.Embed(title=lang['HELP']['embed.title'], description=lang['HELP']['embed.description'], colour=nextcord.Color.green())
+    for section in ('KARMA', 'DASHBOARD', 'PING', 'HELP'):
+        embed.add_field(name=f"**· /{lang[section]['name']}**", value=f"{lang[section]['description']}", inline=False)
+    return embed
+
+
+BUILDERS = {'deletion': build_deletion, 'log': build_log, 'dashboard': build_dashboard, 'help': build_help}
+
+
+def deletion(lang, evaluation, avatar):
+    data = skeleton(lang, 'deletion')
+    return nextcord.Embed.from_dict({**data, 'description': lang.format('DELETION', 'description', evaluation),
+                                     'author': author(lang['DELETION']['title'], avatar)})
+
+
+def log(lang, message, evaluation):
+    data = skeleton(lang, 'log')
+    user, channel, negativity = data['names']
+    return nextcord.Embed.from_dict({'type': data['type'], 'color': data['color'], 'description': message.content,
+                                     'author': author(lang['LOG']['title'], message.author.avatar),
+                                     'fields': [field(user, message.author.mention),
+                                                field(channel, message.channel.mention),
+                                                field(negativity, f'`{evaluation}%`')],
+                                     'footer': {'text': lang.format('LOG', 'footer', message.author.id, message.id)}})
+
+
+def dashboard(lang, guild_name, delete_percentage, reaction_percentage, logging_channel):
+    data = skeleton(lang, 'dashboard')
+    delete, reaction, channel = data['names']
+    return nextcord.Embed.from_dict({'type': data['type'], 'color': data['color'], 'description': data['description'],
+                                     'title': lang.format('DASHBOARD', 'embed.title', guild_name),
+                                     'fields': [field(delete, delete_percentage),
+                                                field(reaction, reaction_percentage),
+                                                field(channel, logging_channel)],
+                                     'footer': data['footer']})
+
+
+def help_menu(lang):
+    return skeleton(lang, 'help')
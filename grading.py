@@ -1,63 +1,26 @@
-class get_grade:
-    def __init__(self, grade):
-        self.grade = grade
+from bisect import bisect_right
+from collections import namedtuple
 
-    def letter_grade(self):
-        grade = self.grade
+Grade = namedtuple('Grade', ['letter', 'color'])
 
-        if grade >= 97:
-            return 'A+'
-        elif grade >= 93:
-            return 'A'
-        elif grade >= 90:
-            return 'A-'
-        elif grade >= 87:
-            return 'B+'
-        elif grade >= 83:
-            return 'B'
-        elif grade >= 80:
-            return 'B-'
-        elif grade >= 77:
-            return 'C+'
-        elif grade >= 73:
-            return 'C'
-        elif grade >= 70:
-            return 'C-'
-        elif grade >= 67:
-            return 'D+'
-        elif grade >= 63:
-            return 'D'
-        elif grade >= 60:
-            return 'D-'
-        else:
-            return 'F'
+# lowest score of every grade above F, in ascending order
+THRESHOLDS = [60, 63, 67, 70, 73, 77, 80, 83, 87, 90, 93, 97]
+GRADES = [
+    Grade('F', 0x6D758D),
+    Grade('D-', 0x242234),
+    Grade('D', 0x793A80),
+    Grade('D+', 0xF5A097),
+    Grade('C-', 0xF9A31B),
+    Grade('C', 0xFFD541),
+    Grade('C+', 0xFFFC40),
+    Grade('B-', 0x328464),
+    Grade('B', 0x59C135),
+    Grade('B+', 0xD6F264),
+    Grade('A-', 0x249FDE),
+    Grade('A', 0x20D6C7),
+    Grade('A+', 0x92DCBA),
+]
 
-    def color(self):
-        grade = self.grade
 
-        if grade >= 97:
-            return 0x92DCBA
-        elif grade >= 93:
-            return 0X20D6C7
-        elif grade >= 90:
-            return 0X249FDE
-        elif grade >= 87:
-            return 0xD6F264
-        elif grade >= 83:
-            return 0x59C135
-        elif grade >= 80:
-            return 0x328464
-        elif grade >= 77:
-            return 0xFFFC40
-        elif grade >= 73:
-            return 0xFFD541
-        elif grade >= 70:
-            return 0xF9A31B
-        elif grade >= 67:
-            return 0xF5A097
-        elif grade >= 63:
-            return 0x793A80
-        elif grade >= 60:
-            return 0x242234
-        else:
-            return 0x6D758D
\ No newline at end of file
+def get_grade(score):
+    return GRADES[bisect_right(THRESHOLDS, score)]
@@ -0,0 +1,257 @@
+BUCKET_WIDTH = 5
+BUCKETS = 100 // BUCKET_WIDTH
+
+# Users are spread over this many small hashes (karma:{n}, decay:{n}) so each
+# one stays in Redis' compact listpack encoding. That needs fewer fields than
+# hash-max-listpack-entries (128 by default) and values under
+# hash-max-listpack-value (64 bytes): 10 million users come to about 76 per
+# hash. Changing it means moving the data with migrate.py.
+USER_BUCKETS = 131072
+
+
+def bucket(manner):
+    return max(0, min(int(manner // BUCKET_WIDTH), BUCKETS - 1))
+
+
+# The low bits of a snowflake are a per-process increment that is almost
+# always 0, so users are bucketed by their millisecond creation timestamp.
+def user_bucket(user_id):
+    return (int(user_id) >> 22) % USER_BUCKETS
+
+
+def user_key(user_id):
+    return f'karma:{user_bucket(user_id)}'
+
+
+def decay_key(user_id):
+    return f'decay:{user_bucket(user_id)}'
+
+
+def unpack(value):
+    total, count = value.split(':')
+    return float(total), int(count)
+
+
+def unpack_decayed(value):
+    total, weight, updated = value.split(':')
+    return float(total), float(weight), float(updated)
+
+
+# Reads a user's "total:count" field, moving the legacy val:/msg: keys into
+# it first if they are still around.
+# KEYS: karma:{n}, val:{user}, msg:{user}
+# ARGV: user id
+LOAD = """
+local function load()
+    local legacy = redis.call('GET', KEYS[2])
+    local current = redis.call('HGET', KEYS[1], ARGV[1])
+    if not legacy then
+        return current
+    end
+    local total = tonumber(legacy)
+    local count = tonumber(redis.call('GET', KEYS[3]) or '0')
+    if current then
+        local separator = string.find(current, ':', 1, true)
+        total = total + tonumber(string.sub(current, 1, separator - 1))
+        count = count + tonumber(string.sub(current, separator + 1))
+    end
+    current = tostring(total) .. ':' .. tostring(count)
+    redis.call('HSET', KEYS[1], ARGV[1], current)
+    redis.call('DEL', KEYS[2], KEYS[3])
+    return current
+end
+"""
+
+MIGRATE = LOAD + """
+return load()
+"""
+
+# Moves a user's field to the hash it belongs in, adding it to what the bot
+# may have written there already. Works for both "total:count" and
+# "sum:weight:updated": the first two numbers add up, the timestamp is the
+# later of the two.
+# KEYS: hash the field is in, hash it belongs in
+# ARGV: user id
+REBUCKET = """
+local value = redis.call('HGET', KEYS[1], ARGV[1])
+if not value then
+    return 0
+end
+local current = redis.call('HGET', KEYS[2], ARGV[1])
+if current then
+    local parts = {}
+    for part in string.gmatch(value, '[^:]+') do
+        table.insert(parts, tonumber(part))
+    end
+    local i = 1
+    for part in string.gmatch(current, '[^:]+') do
+        if i < 3 then
+            parts[i] = parts[i] + tonumber(part)
+        else
+            parts[i] = math.max(parts[i], tonumber(part))
+        end
+        i = i + 1
+    end
+    for j = 1, #parts do
+        parts[j] = tostring(parts[j])
+    end
+    value = table.concat(parts, ':')
+end
+redis.call('HSET', KEYS[2], ARGV[1], value)
+redis.call('HDEL', KEYS[1], ARGV[1])
+return 1
+"""
+
+# Adds an evaluation to the user's "total:count" field.
+# KEYS: karma:{n}, val:{user}, msg:{user}
+# ARGV: user id, evaluation
+ACCUMULATE = LOAD + """
+local function accumulate()
+    local total = tonumber(ARGV[2])
+    local count = 1
+    local current = load()
+    if current then
+        local separator = string.find(current, ':', 1, true)
+        total = total + tonumber(string.sub(current, 1, separator - 1))
+        count = count + tonumber(string.sub(current, separator + 1))
+    end
+    redis.call('HSET', KEYS[1], ARGV[1], tostring(total) .. ':' .. tostring(count))
+    return total, count
+end
+"""
+
+# Moves the user in the manner ranking and keeps the histograms of manner
+# scores (hist:global and, in a guild, hist:{guild}) up to date as the
+# user's score moves between buckets. A guild histogram counts the users
+# who posted in that guild, with the bucket they had when they last did.
+# ARGV: user id, evaluation, bucket width, bucket count
+RANK = """
+local width = tonumber(ARGV[3])
+local last = tonumber(ARGV[4]) - 1
+local function bucket(manner)
+    return math.max(0, math.min(math.floor(manner / width), last))
+end
+
+local function rank(manner, ranking, global, guild, seen_key)
+    local previous = redis.call('ZSCORE', ranking, ARGV[1])
+    redis.call('ZADD', ranking, manner, ARGV[1])
+
+    local index = bucket(manner)
+    if not previous then
+        redis.call('HINCRBY', global, index, 1)
+    elseif bucket(tonumber(previous)) ~= index then
+        redis.call('HINCRBY', global, bucket(tonumber(previous)), -1)
+        redis.call('HINCRBY', global, index, 1)
+    end
+
+    if guild then
+        local seen = redis.call('HGET', seen_key, ARGV[1])
+        if not seen or tonumber(seen) ~= index then
+            if seen then
+                redis.call('HINCRBY', guild, seen, -1)
+            end
+            redis.call('HINCRBY', guild, index, 1)
+            redis.call('HSET', seen_key, ARGV[1], index)
+        end
+    end
+end
+"""
+
+# Accumulates a message's evaluation into the user's karma and updates the
+# manner ranking in a single round trip.
+# KEYS: karma:{n}, val:{user}, msg:{user}, manner, hist:global[, hist:{guild}, hb:{guild}]
+# ARGV: user id, evaluation, bucket width, bucket count
+RECORD = ACCUMULATE + RANK + """
+local total, count = accumulate()
+local manner = 100 - total / count
+rank(manner, KEYS[4], KEYS[5], KEYS[6], KEYS[7])
+return tostring(manner)
+"""
+
+# Same as RECORD, but the manner score is an exponentially weighted mean: the
+# user's decay:{n} field holds "sum:weight:updated", and before a new
+# evaluation is added both are multiplied by 0.5 ^ (elapsed / half_life).
+# Decaying both by the same factor leaves their ratio alone, so the score
+# only has to be decayed here, when it changes, and never on read or by a
+# sweep. The lifetime totals are still kept, so the mode can be turned off.
+# A user without a decay field yet starts from their lifetime mean, with at
+# most cap messages worth of weight.
+# KEYS: karma:{n}, val:{user}, msg:{user}, manner, hist:global, decay:{n}[, hist:{guild}, hb:{guild}]
+# ARGV: user id, evaluation, bucket width, bucket count, half life in seconds, cap
+RECORD_DECAYED = ACCUMULATE + RANK + """
+local evaluation = tonumber(ARGV[2])
+local total, count = accumulate()
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local sum, weight, updated
+local state = redis.call('HGET', KEYS[6], ARGV[1])
+if state then
+    local first = string.find(state, ':', 1, true)
+    local second = string.find(state, ':', first + 1, true)
+    sum = tonumber(string.sub(state, 1, first - 1))
+    weight = tonumber(string.sub(state, first + 1, second - 1))
+    updated = tonumber(string.sub(state, second + 1))
+else
+    local previous = count - 1
+    weight = math.min(previous, tonumber(ARGV[6]))
+    sum = previous > 0 and (total - evaluation) / previous * weight or 0
+    updated = now
+end
+local decay = 0.5 ^ (math.max(0, now - updated) / tonumber(ARGV[5]))
+sum = sum * decay + evaluation
+weight = weight * decay + 1
+redis.call('HSET', KEYS[6], ARGV[1], tostring(sum) .. ':' .. tostring(weight) .. ':' .. tostring(now))
+local manner = 100 - sum / weight
+rank(manner, KEYS[4], KEYS[5], KEYS[7], KEYS[8])
+return tostring(manner)
+"""
+
+
+# With half_life (in seconds) the manner scores are exponentially weighted
+# means instead of lifetime means, see RECORD_DECAYED.
+class KarmaStore:
+    def __init__(self, redis, half_life=None, cap=100):
+        self.redis = redis
+        self.half_life = half_life
+        self.cap = cap
+        self.record_script = redis.register_script(RECORD if half_life is None else RECORD_DECAYED)
+
+    async def record(self, user_id, evaluation, guild_id=None):
+        keys = [user_key(user_id), f'val:{user_id}', f'msg:{user_id}', 'manner', 'hist:global']
+        args = [user_id, evaluation, BUCKET_WIDTH, BUCKETS]
+        if self.half_life is not None:
+            keys.append(decay_key(user_id))
+            args += [self.half_life, self.cap]
+        if guild_id is not None:
+            keys += [f'hist:{guild_id}', f'hb:{guild_id}']
+        return float(await self.record_script(keys=keys, args=args))
+
+    # returns (manner, count, rank, users); manner is None for unknown users
+    async def get(self, user_id):
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hget(user_key(user_id), user_id)
+            pipe.get(f'val:{user_id}')
+            pipe.get(f'msg:{user_id}')
+            pipe.zrevrank('manner', user_id)
+            pipe.zcard('manner')
+            if self.half_life is not None:
+                pipe.hget(decay_key(user_id), user_id)
+            current, legacy_total, legacy_count, ranking, total_users, *state = await pipe.execute()
+        total, count = unpack(current) if current is not None else (None, 0)
+        if legacy_total is not None:
+            total = (total or 0) + float(legacy_total)
+            count += int(legacy_count or 0)
+        if total is None:
+            return None, 0, ranking, total_users
+        if state and state[0] is not None:
+            # the ratio does not change with decay, so there is nothing to apply here
+            decayed, weight, updated = unpack_decayed(state[0])
+            return 100 - decayed / weight, count, ranking, total_users
+        return 100 - total / count, count, ranking, total_users
+
+    async def histogram(self, guild_id=None):
+        counts = await self.redis.hgetall(f'hist:{guild_id}' if guild_id is not None else 'hist:global')
+        histogram = [0] * BUCKETS
+        for index, count in counts.items():
+            histogram[int(index)] = int(count)
+        return histogram
@@ -0,0 +1,58 @@
+import configparser
+import os
+from types import MappingProxyType
+
+
+# One language file compiled into read-only tables. Values are interpolated
+# once when loading and their str.format is kept bound, so handlers only pay
+# for a dict lookup and the formatting itself. Keys missing from the file are
+# taken from the fallback locale.
+class Locale:
+    def __init__(self, name, parser, fallback=None):
+        sections = {}
+        if fallback is not None:
+            for section, values in fallback.sections.items():
+                sections[section] = dict(values)
+        for section in parser.sections():
+            sections.setdefault(section, {}).update({key: parser[section][key] for key in parser[section]})
+
+        self.name = name
+        self.sections = MappingProxyType({section: MappingProxyType(values) for section, values in sections.items()})
+        self.formats = MappingProxyType({(section, key): value.format
+                                         for section, values in sections.items() for key, value in values.items()})
+
+    def __getitem__(self, section):
+        return self.sections[section]
+
+    def format(self, section, key, *args):
+        return self.formats[section, key](*args)
+
+
+# Every language file found in the directory, looked up by Discord locale
+# ('en-US', 'ko') or Perspective language code ('en', 'ko'). A file named
+# en_us.ini answers to 'en-US', 'en_us' and, as the first file for that
+# language, to 'en' and any other 'en-*' locale.
+class Catalog:
+    def __init__(self, directory='language', fallback='fallback'):
+        parsers = {}
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith('.ini'):
+                parser = configparser.ConfigParser()
+                parser.read(os.path.join(directory, filename), encoding='utf-8')
+                parsers[filename[:-4].lower()] = parser
+
+        self.fallback = Locale(fallback, parsers.pop(fallback))
+        self.locales = {name: Locale(name, parser, self.fallback) for name, parser in parsers.items()}
+        self.lookup = {}
+        for name, locale in self.locales.items():
+            self.lookup[name] = locale
+            self.lookup.setdefault(name.split('_')[0], locale)
+
+    def get(self, locale):
+        key = str(locale)
+        compiled = self.lookup.get(key)
+        if compiled is None:
+            name = key.lower().replace('-', '_')
+            compiled = self.lookup.get(name) or self.lookup.get(name.split('_')[0]) or self.fallback
+            self.lookup[key] = compiled
+        return compiled
@@ -1,30 +1,45 @@
 # imports
+import asyncio
 import configparser
+import io
+import json
+import os
 import platform
+import sys
+import threading
 import time
 
+import httplib2
 import nextcord
 import redis
+import redis.asyncio as aioredis
 from nextcord import Interaction
 from nextcord.ext import commands
 from googleapiclient import discovery
-
-import numpy as np
-from matplotlib import pyplot as plt
-
+from googleapiclient.errors import HttpError
+
+import embeds
+import metrics
+from assets import Badges
+from backfill import backfill, needs_backfill
+from cache import ToxicityCache
+from cluster import heartbeat, shard_env
+from deferred import DeferredScoring
+from distribution import DistributionCache
 from grading import get_grade
+from karma import KarmaStore
+from localization import Catalog
+from moderation import Deleter, LogDispatcher, Notices
+from scheduler import DEFERRED, HIGH, Scheduler
+from scoring import CircuitBreaker, RedisTokenBucket, Scorer, Unavailable
+from settings import GuildSettings
+from triage import Classifier, Heuristics, Triage
 
 # load config & language
 config = configparser.ConfigParser()
-config.read('config.ini')
-fallback_lang = configparser.ConfigParser()
-fallback_lang.read('language/fallback.ini')
-english = configparser.ConfigParser()
-english.read('language/en_us.ini')
-korean = configparser.ConfigParser()
-korean.read('language/ko_kr.ini')
-chinese = configparser.ConfigParser()
-chinese.read('language/zh_cn.ini')
+config.read(os.environ.get('CHAT_KARMA_CONFIG', 'config.ini'))
+catalog = Catalog('language')
+fallback_lang = catalog.fallback
 
 token = config['CREDENTIALS']['token']
 owner_id = str(config['CREDENTIALS']['owner_id'])
@@ -58,69 +73,238 @@ if len(status_message) > 128:
 
 if error_count > 0:
     print('Please change the config file (config.ini) and try again.')
-    print('Exiting in 5 seconds...')
-    time.sleep(5)
-    exit()
+    sys.exit(1)
 
 # check redis connection
 try:
     print(f'Connecting to Redis... ({host}:{port} Database: {db})')
     r = redis.Redis(host=host, port=port, password=password, decode_responses=True, db=db)
     r.ping()
+    pool = aioredis.ConnectionPool(host=host, port=port, password=password, decode_responses=True, db=db,
+                                   max_connections=config['REDIS'].getint('max_connections', 32))
+    ar = aioredis.Redis(connection_pool=pool)
     print(f'Connected to redis.')
 except:
     print('Error: Could not connect to Redis server.')
     print('Please change the config file (config.ini) and try again.')
-    print('Exiting in 5 seconds...')
-    time.sleep(5)
-    exit()
+    sys.exit(1)
 
+# the discovery document is bundled so startup never waits on the network
 try:
-    google = discovery.build(
-        "commentanalyzer",
-        "v1alpha1",
-        developerKey=config['GOOGLE']['api_key'],
-        discoveryServiceUrl="https://commentanalyzer.googleapis.com/$discovery/rest?version=v1alpha1",
-        static_discovery=False,
-    )
+    with open('commentanalyzer.json') as f:
+        document = json.load(f)
+    # lets the bot talk to a stand-in server, e.g. benchmarks/fake_perspective.py
+    if config['GOOGLE'].get('root_url'):
+        document['rootUrl'] = document['baseUrl'] = config['GOOGLE']['root_url']
+    google = discovery.build_from_document(document, developerKey=config['GOOGLE']['api_key'])
 except:
-    print('Error: Could not connect to Google API.')
-    print('Please change the config file (config.ini) and try again.')
-    print('Exiting in 5 seconds...')
-    time.sleep(5)
-    exit()
+    print('Error: Could not load the Perspective API discovery document (commentanalyzer.json).')
+    sys.exit(1)
 
 # discord setup
 intents = nextcord.Intents.default()
 intents.members = True
 intents.message_content = True
 
-client = commands.Bot(command_prefix=prefix, intents=intents)
+# set by cluster.py when this process is one of several workers
+shards = shard_env()
+if shards is None:
+    client = commands.Bot(command_prefix=prefix, intents=intents)
+else:
+    client = commands.AutoShardedBot(command_prefix=prefix, intents=intents, shard_ids=shards[0], shard_count=shards[1])
+
+# httplib2 is not thread-safe, so every scoring thread gets its own connection
+http_local = threading.local()
+
+
+def thread_http():
+    if not hasattr(http_local, 'http'):
+        http_local.http = httplib2.Http()
+    return http_local.http
+
+
+def analyze_request(expression):
+    return google.comments().analyze(body={'comment': {'text': expression}, 'requestedAttributes': {'TOXICITY': {}}})
+
+
+def parse_response(response):
+    toxicity = round(100 * (response['attributeScores']['TOXICITY']['summaryScore']['value']), 2)
+    language = response['languages']
+    return {'toxicity': toxicity, 'language': language}
+
 
 def eveluate(expression):
-    analyze_request = {'comment': {'text': expression}, 'requestedAttributes': {'TOXICITY': {}}}
     try:
-        response = google.comments().analyze(body=analyze_request).execute()
-        toxicity = round(100 * (response['attributeScores']['TOXICITY']['summaryScore']['value']), 2)
-        language = response['languages']
-        return {'toxicity': toxicity, 'language': language}
+        with metrics.api_latency.time():
+            return parse_response(analyze_request(expression).execute(http=thread_http()))
     except:
-        return None
+        metrics.api_errors.inc()
+        raise
+
+
+# scores several messages with one batch HTTP request
+def eveluate_batch(expressions):
+    results = [None] * len(expressions)
+
+    def callback(request_id, response, exception):
+        if exception is None:
+            try:
+                results[int(request_id)] = parse_response(response)
+                return
+            except Exception as e:
+                exception = e
+        results[int(request_id)] = exception
+        metrics.api_errors.inc()
+
+    batch = google.new_batch_http_request(callback=callback)
+    for i, expression in enumerate(expressions):
+        batch.add(analyze_request(expression), request_id=str(i))
+    try:
+        with metrics.api_latency.time():
+            batch.execute(http=thread_http())
+    except Exception as e:
+        metrics.api_errors.inc(amount=sum(result is None for result in results))
+        results = [e if result is None else result for result in results]
+    return results
+
+
+# throttling, server errors and network trouble are worth another try
+def transient(error):
+    if isinstance(error, HttpError):
+        return error.resp.status == 429 or error.resp.status >= 500
+    return isinstance(error, (OSError, httplib2.HttpLib2Error))
+
+
+# workers share one quota through Redis
+bucket = None
+if shards is not None or config['GOOGLE'].getboolean('shared_quota', False):
+    bucket = RedisTokenBucket(ar, config['GOOGLE'].getfloat('qps', 1),
+                              max(config['GOOGLE'].getint('burst', 1), config['GOOGLE'].getint('batch_size', 1)))
+scorer = Scorer(eveluate,
+                workers=config['GOOGLE'].getint('workers', 4),
+                queue_size=config['GOOGLE'].getint('queue_size', 256),
+                rate=config['GOOGLE'].getfloat('qps', 1),
+                burst=config['GOOGLE'].getint('burst', 1),
+                batch_func=eveluate_batch,
+                batch_size=config['GOOGLE'].getint('batch_size', 1),
+                batch_window=config['GOOGLE'].getfloat('batch_window', 5) / 1000,
+                bucket=bucket,
+                retries=config['GOOGLE'].getint('retries', 2),
+                backoff=config['GOOGLE'].getfloat('backoff', 0.5),
+                breaker=CircuitBreaker(config['GOOGLE'].getint('breaker_threshold', 5),
+                                       config['GOOGLE'].getfloat('breaker_reset', 30)),
+                transient=transient,
+                # a worker gets about as much traffic as its part of the shards
+                share=config['GOOGLE'].getfloat('quota_share', len(shards[0]) / shards[1] if shards else 1.0))
+scheduler = Scheduler(scorer, ar,
+                      max_backlog=config['SCHEDULER'].getfloat('max_backlog', 5),
+                      sample_rate=config['SCHEDULER'].getfloat('sample_rate', 0.25),
+                      defer_limit=config['SCHEDULER'].getfloat('defer_limit', 0.5),
+                      new_account_days=config['SCHEDULER'].getfloat('new_account_days', 7),
+                      low_manner=config['SCHEDULER'].getfloat('low_manner', 60),
+                      trusted_manner=config['SCHEDULER'].getfloat('trusted_manner', 90),
+                      strict_delete=config['SCHEDULER'].getint('strict_delete', 50))
+deferred_scoring = DeferredScoring(ar, scorer.breaker,
+                                   consumer=f'worker-{shards[2]}' if shards else 'main',
+                                   max_length=config['DEFERRED'].getint('max_length', 100000),
+                                   batch=config['DEFERRED'].getint('batch', 16),
+                                   claim_after=config['DEFERRED'].getint('claim_after', 300))
+# moderating a message this many seconds after it was sent does more harm than good
+stale_after = config['DEFERRED'].getfloat('stale_after', 120)
+
+
+# days, 0 keeps lifetime means
+half_life = config['KARMA'].getfloat('half_life', 0)
+karma_store = KarmaStore(ar, half_life=half_life * 86400 if half_life > 0 else None,
+                         cap=config['KARMA'].getint('cap', 100))
+guild_settings = GuildSettings(ar)
+badges = Badges('image')
+deleter = Deleter()
+log_dispatcher = LogDispatcher(client, interval=config['MODERATION'].getfloat('log_interval', 2))
+notices = Notices(rate=config['MODERATION'].getfloat('notice_rate', 1),
+                  burst=config['MODERATION'].getint('notice_burst', 3),
+                  max_pending=config['MODERATION'].getint('notice_pending', 5))
+distribution_cache = DistributionCache(karma_store, ttl=config['SETTINGS'].getint('distribution_ttl', 60))
+toxicity_cache = ToxicityCache(ar,
+                               size=config['CACHE'].getint('size', 10000),
+                               ttl=config['CACHE'].getint('ttl', 86400))
+
+
+triage = None
+if config['TRIAGE'].getboolean('enabled', False):
+    model = config['TRIAGE'].get('model', '')
+    commands = [command.strip() for command in config['TRIAGE'].get('commands', '').split(',') if command.strip()]
+    triage = Triage(Heuristics(config['TRIAGE'].getfloat('benign_score', 1.0), commands),
+                    Classifier.load(model) if model else None,
+                    benign_below=config['TRIAGE'].getfloat('benign_below', 10),
+                    shadow_rate=config['TRIAGE'].getfloat('shadow_rate', 0.0))
+
+
+async def evaluate(expression, priority=HIGH, guild_id=None):
+    with metrics.redis_latency.time('cache_get'):
+        response = await toxicity_cache.get(expression)
+    if response is None:
+        response = await scheduler.score(expression, priority, guild_id)
+        if response is not None:
+            with metrics.redis_latency.time('cache_set'):
+                await toxicity_cache.set(expression, response)
+    return response
+
+
+# skips the API for messages the local triage considers definitely benign
+async def triaged_evaluate(expression, priority=HIGH, guild_id=None):
+    if triage is None:
+        return await evaluate(expression, priority, guild_id)
+    response = triage.check(expression)
+    if response is None:
+        return await evaluate(expression, priority, guild_id)
+    if response['toxicity'] is not None and triage.shadow():
+        try:
+            scored = await evaluate(expression, priority, guild_id)
+        except Unavailable:
+            scored = None
+        if scored is not None:
+            triage.record(scored)
+            return scored
+    return response
 
 
 def lang_check(locale):
-    if locale in ["en-US", "en"]:
-        return english
-    elif locale == "ko":
-        return korean
-    # elif locale == "zh-CN":
-    #     return chinese
-    # else:
-    return fallback_lang
+    return catalog.get(locale)
+
+
+metrics_runner = None
+heartbeat_task = None
+command_started = {}
+
+
+async def before_command(interaction):
+    command_started[interaction.id] = time.perf_counter()
+
+
+async def after_command(interaction):
+    started = command_started.pop(interaction.id, None)
+    if started is not None:
+        metrics.command_latency.observe(time.perf_counter() - started, interaction.application_command.qualified_name)
+
+
+if config['METRICS'].getboolean('commands', False):
+    client.application_command_before_invoke(before_command)
+    client.application_command_after_invoke(after_command)
+
 
 # Bot startup
 @client.event
 async def on_ready():
+    global metrics_runner, heartbeat_task
+    guild_settings.start()
+    if config['METRICS'].getboolean('enabled', False) and metrics_runner is None:
+        # every worker on the machine gets its own port
+        metrics_runner = await metrics.serve(config['METRICS'].get('host', '127.0.0.1'),
+                                             config['METRICS'].getint('port', 9100) + (shards[2] if shards else 0))
+    if shards is not None and heartbeat_task is None:
+        heartbeat_task = asyncio.get_running_loop().create_task(heartbeat(client, ar, shards[2]))
+    deferred_scoring.start(score_deferred, ready=lambda: not scheduler.overloaded())
     # set status
     if status_type == 'playing':
         await client.change_presence(activity=nextcord.Game(name=status_message), status=status)
@@ -142,63 +326,88 @@ async def on_ready():
     print('======================================')
 
 
+async def moderate(message, evaluation, lang, delete_percentage, reaction_percentage, log_channel):
+    if delete_percentage is None:
+        delete_percentage = 70
+    else:
+        delete_percentage = int(delete_percentage)
+
+    if delete_percentage > 0:
+        if evaluation > delete_percentage:
+            await deleter.delete(message)
+            metrics.messages.inc(message.guild.id, 'deleted')
+            notices.send(message.channel, content=f'{message.author.mention}',
+                         embed=embeds.deletion(lang, evaluation, message.author.avatar), delete_after=5)
+
+            if log_channel != None:
+                log_dispatcher.add(int(log_channel), embeds.log(lang, message, evaluation))
+            return
+    if reaction_percentage is None:
+        reaction_percentage = 50
+    else:
+        reaction_percentage = int(reaction_percentage)
+    if reaction_percentage > 0:
+        if evaluation > reaction_percentage:
+            with metrics.discord_latency.time('reaction'):
+                await message.add_reaction('💔')
+            metrics.messages.inc(message.guild.id, 'reacted')
+
+
 @client.event
 async def on_message(message):
-    if message.author.bot:
+    # attachments and stickers only, there is nothing to score
+    if message.author.bot or not message.content.strip():
+        return
+    with metrics.redis_latency.time('settings'):
+        settings = await guild_settings.get(message.guild.id)
+    priority = scheduler.priority(message.author, settings[0])
+    try:
+        response = await triaged_evaluate(message.content, priority, message.guild.id)
+    except Unavailable:
+        # scored later by score_deferred
+        deferred_scoring.add(message)
+        metrics.messages.inc(message.guild.id, 'unscored')
+        return
+    if response is None or response['toxicity'] is None:
+        # skipped under overload, or the API could not score it
         return
-    response = eveluate(message.content)
     evaluation = response['toxicity']
-    lang = lang_check(response['language'][0])
-    if evaluation is not None:
-        evalue = r.get(f'val:{message.author.id}')
-        message_count = r.get(f'msg:{message.author.id}')
-        if evalue is None:
-            total_evaluation = evaluation
-            total_message = 1
-            r.set(f'val:{message.author.id}', total_evaluation)
-            r.set(f'msg:{message.author.id}', total_message)
-        else:
-            total_evaluation = float(evalue) + evaluation
-            total_message = int(message_count) + 1
-            r.set(f'val:{message.author.id}', (float(evalue) + evaluation))
-            r.set(f'msg:{message.author.id}', int(message_count) + 1)
-
-        manner_score = 100 - (total_evaluation / total_message)
-        r.zadd('manner', {message.author.id: manner_score})
-
-        delete_percentage = r.get(f'del:{message.guild.id}')
-        if delete_percentage is None:
-            delete_percentage = 70
-        else:
-            delete_percentage = int(delete_percentage)
-
-        if delete_percentage > 0:
-            if evaluation > delete_percentage:
-                await message.delete()
-                embed = nextcord.Embed(title='', description=lang['DELETION']['description'].format(evaluation),
-                                       color=nextcord.Color.red())
-                embed.set_author(name=lang['DELETION']['title'], icon_url=message.author.avatar)
-                embed.set_footer(text=lang['DELETION']['footer'])
-                await message.channel.send(content=f'{message.author.mention}', embed=embed, delete_after=5)
-
-                log_channel = r.get(f'log:{message.guild.id}')
-                if log_channel != None:
-                    embed = nextcord.Embed(title='', description=message.content, colour=nextcord.Color.red())
-                    embed.set_author(name=lang['LOG']['title'], icon_url=message.author.avatar)
-                    embed.add_field(name=lang['LOG']['user'], value=message.author.mention)
-                    embed.add_field(name=lang['LOG']['channel'], value=message.channel.mention)
-                    embed.add_field(name=lang['LOG']['negativity'], value=f'`{evaluation}%`')
-                    embed.set_footer(text=lang['LOG']['footer'].format(message.author.id, message.id))
-                    await client.get_channel(int(log_channel)).send(embed=embed)
-                return
-        reaction_percentage = r.get(f'rea:{message.guild.id}')
-        if reaction_percentage is None:
-            reaction_percentage = 50
-        else:
-            reaction_percentage = int(reaction_percentage)
-        if reaction_percentage > 0:
-            if evaluation > reaction_percentage:
-                await message.add_reaction('💔')
+    with metrics.redis_latency.time('record'):
+        manner_score = await karma_store.record(message.author.id, evaluation, message.guild.id)
+    scheduler.remember(message.author.id, manner_score)
+    metrics.messages.inc(message.guild.id, 'scored')
+    if time.time() - message.created_at.timestamp() > stale_after:
+        metrics.messages.inc(message.guild.id, 'stale')
+        return
+    await moderate(message, evaluation, lang_check(response['language'][0]), *settings)
+
+
+# scores a message from the deferred stream; raises Unavailable while the API is still down
+async def score_deferred(fields):
+    response = await toxicity_cache.get(fields['content'])
+    if response is None:
+        response = await scorer.score(fields['content'], DEFERRED)
+        if response is not None:
+            await toxicity_cache.set(fields['content'], response)
+    if response is None or response['toxicity'] is None:
+        metrics.deferred.inc('failed')
+        return
+    evaluation = response['toxicity']
+    manner_score = await karma_store.record(int(fields['author']), evaluation, int(fields['guild']))
+    scheduler.remember(int(fields['author']), manner_score)
+    metrics.deferred.inc('scored')
+    if time.time() - float(fields['created']) > stale_after:
+        metrics.deferred.inc('stale')
+        return
+    channel = client.get_channel(int(fields['channel']))
+    if channel is None:
+        return
+    try:
+        message = await channel.fetch_message(int(fields['message']))
+    except nextcord.HTTPException:
+        # deleted in the meantime
+        return
+    await moderate(message, evaluation, lang_check(response['language'][0]), *await guild_settings.get(message.guild.id))
 
 
 @client.slash_command(name=fallback_lang['KARMA']['name'], description=fallback_lang['KARMA']['description'], dm_permission=True)
@@ -214,28 +423,33 @@ async def karma(interaction: Interaction,
     if user.bot:
         await interaction.response.send_message(embed=nextcord.Embed(title=lang['KARMA']['error.title'], description=lang['KARMA']['error.bot'], colour=nextcord.Color.red()), ephemeral=True)
         return
-    evalue = r.get(f'val:{user.id}')
-    message_count = r.get(f'msg:{user.id}')
-    if evalue is None:
+    manner, message_count, ranking, total_users = await karma_store.get(user.id)
+    if manner is None:
         await interaction.response.send_message(embed=nextcord.Embed(title=lang['KARMA']['error.title'], description=lang['KARMA']['error.nothing'], colour=nextcord.Color.red()), ephemeral=True)
         return
     else:
-        ranking = r.zrevrank('manner', user.id) + 1
-        total_users = r.zcard('manner')
+        ranking = ranking + 1
         top_percent = round((ranking / total_users) * 100, 2)
 
-        evaluation = 100 - round(float(evalue) / int(message_count), 2)
-        embed = nextcord.Embed(title=f'', colour=get_grade(evaluation).color())
+        evaluation = round(manner, 2)
+        grade = get_grade(evaluation)
+        embed = nextcord.Embed(title=f'', colour=grade.color)
         embed.add_field(name=lang['KARMA']['embed.manner'], value=lang['KARMA']['embed.manner.description'].format(evaluation), inline=True)
         embed.add_field(name=lang['KARMA']['embed.rank'], value=lang['KARMA']['embed.rank.description'].format(top_percent, ranking, total_users), inline=True)
         embed.set_author(name=lang['KARMA']['embed.title'].format(user.display_name), icon_url=user.avatar)
 
         embed.set_footer(text=lang['KARMA']['embed.footer'].format(message_count))
 
-        img = nextcord.File(f'image/{get_grade(evaluation).letter_grade()}.png', filename='image.png')
-        embed.set_thumbnail(url='attachment://image.png')
-
-        await interaction.response.send_message(embed=embed, file=img)
+        thumbnail = badges.url(grade.letter)
+        if thumbnail is not None:
+            embed.set_thumbnail(url=thumbnail)
+            await interaction.response.send_message(embed=embed)
+        else:
+            embed.set_thumbnail(url='attachment://image.png')
+            await interaction.response.send_message(embed=embed, file=badges.file(grade.letter))
+            sent = await interaction.original_message()
+            if sent.embeds and sent.embeds[0].thumbnail.url:
+                badges.remember(grade.letter, sent.embeds[0].thumbnail.url)
 
 @client.slash_command(name=fallback_lang['PING']['name'], description=fallback_lang['PING']['description'],
                       dm_permission=True)
@@ -250,35 +464,29 @@ async def ping(interaction: Interaction):
 async def dashboard(interaction: Interaction):
     lang = lang_check(interaction.locale)
 
-    delete_percentage = r.get(f'del:{interaction.guild.id}')
+    delete_percentage, reaction_percentage, logging_channel = await guild_settings.get(interaction.guild.id)
     if delete_percentage is None:
         delete_percentage = 70
-        delete_percentage = lang['DASHBOARD']['text.negative'].format(delete_percentage)
+        delete_percentage = lang.format('DASHBOARD', 'text.negative', delete_percentage)
     elif delete_percentage == '0':
         delete_percentage = lang['DASHBOARD']['text.disabled']
     else:
-        delete_percentage = lang['DASHBOARD']['text.negative'].format(delete_percentage)
+        delete_percentage = lang.format('DASHBOARD', 'text.negative', delete_percentage)
 
-    reaction_percentage = r.get(f'rea:{interaction.guild.id}')
     if reaction_percentage is None:
         reaction_percentage = 50
-        reaction_percentage = lang['DASHBOARD']['text.negative'].format(reaction_percentage)
+        reaction_percentage = lang.format('DASHBOARD', 'text.negative', reaction_percentage)
     elif reaction_percentage == '0':
         reaction_percentage = lang['DASHBOARD']['text.disabled']
     else:
-        reaction_percentage = lang['DASHBOARD']['text.negative'].format(reaction_percentage)
+        reaction_percentage = lang.format('DASHBOARD', 'text.negative', reaction_percentage)
 
-    logging_channel = r.get(f'log:{interaction.guild.id}')
     if logging_channel is None:
         logging_channel = lang['DASHBOARD']['text.disabled']
     else:
         logging_channel = f'<#{logging_channel}>'
 
-    embed = nextcord.Embed(title=lang['DASHBOARD']['embed.title'].format(interaction.guild.name), description=lang['DASHBOARD']['embed.description'], colour=nextcord.Color.green())
-    embed.add_field(name=lang['DASHBOARD']['embed.delete'], value=delete_percentage, inline=True)
-    embed.add_field(name=lang['DASHBOARD']['embed.reaction'], value=reaction_percentage, inline=True)
-    embed.add_field(name=lang['DASHBOARD']['embed.log'], value=f'{logging_channel}', inline=True)
-    embed.set_footer(text=lang['DASHBOARD']['embed.footer'])
+    embed = embeds.dashboard(lang, interaction.guild.name, delete_percentage, reaction_percentage, f'{logging_channel}')
 
     selections = [
         nextcord.SelectOption(label=lang['DASHBOARD']['dropdown.delete'], value='del', emoji='🧹'),
@@ -294,41 +502,22 @@ async def dashboard(interaction: Interaction):
 async def help(interaction: Interaction):
     lang = lang_check(interaction.locale)
 
-    embed = nextcord.Embed(title=lang['HELP']['embed.title'], description=lang['HELP']['embed.description'], colour=nextcord.Color.green())
-    embed.add_field(name=f"**· /{lang['KARMA']['name']}**", value=f"{lang['KARMA']['description']}", inline=False)
-    embed.add_field(name=f"**· /{lang['DASHBOARD']['name']}**", value=f"{lang['DASHBOARD']['description']}", inline=False)
-    embed.add_field(name=f"**· /{lang['PING']['name']}**", value=f"{lang['PING']['description']}", inline=False)
-    embed.add_field(name=f"**· /{lang['HELP']['name']}**", value=f"{lang['HELP']['description']}", inline=False)
-
-    await interaction.response.send_message(embed=embed, ephemeral=True)
+    await interaction.response.send_message(embed=embeds.help_menu(lang), ephemeral=True)
 
 
 @client.slash_command(name='distribution', description='Shows the distribution of karma score', dm_permission=True)
 async def distribution(interaction: Interaction):
-    # get karma scores from the database
-    scores = r.zrange('manner', 0, -1, desc=True, withscores=True)
-    scores = [int(score) for member, score in scores]
-
-    # set size of the diagram to 500x300
-    fig = plt.figure(figsize=(5, 3))
-
-    # draw a histogram
-    plt.hist(scores, bins=20)
-
-    # set labels
-    plt.xlabel('Karma score')
-    plt.ylabel('Number of members')
-
-    # save the figure to a temporary file
-    # plt.savefig('image.png')
-
-    await interaction.response.send_message('Not abilable', ephemeral=True)
-
+    image = await distribution_cache.image(interaction.guild.id if interaction.guild else None)
+    await interaction.response.send_message(file=nextcord.File(io.BytesIO(image), filename='distribution.png'))
 
 
 @client.message_command(name=fallback_lang['EVALUATE']['name'])
 async def evaluate_message(interaction: nextcord.Interaction, message: nextcord.Message):
-    evaluation = eveluate(message.content)['toxicity']
+    try:
+        response = await evaluate(message.content)
+    except Unavailable:
+        response = None
+    evaluation = response['toxicity'] if response is not None else None
     lang = lang_check(interaction.locale)
 
     if evaluation is None:
@@ -371,7 +560,7 @@ class Dropdown(nextcord.ui.Select):
                 await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
         elif self.values[0].startswith('set_log:'):
             channel_id = self.values[0].split(':')[1]
-            r.set(f'log:{interaction.guild.id}', channel_id)
+            await guild_settings.set(interaction.guild.id, 'log', channel_id)
             await interaction.response.send_message(embed=nextcord.Embed(title=lang['DROPDOWN']['log.success'], description=lang['DROPDOWN']['log.success.description'].format(f'<#{channel_id}>'), colour=nextcord.Color.green()), ephemeral=True)
 
 
@@ -401,26 +590,20 @@ class Popup(nextcord.ui.Modal):
         if interaction.data['components'][0]['components'][0]['custom_id'] == 'del':
             if self.name.value.isdigit() and 0 <= int(self.name.value) <= 100:
                 await interaction.response.send_message(embed=nextcord.Embed(title=lang['POPUP']['success'], description=lang['POPUP']['success.delete'].format(self.name.value), colour=nextcord.Color.green()), ephemeral=True)
-                r.set(f'del:{interaction.guild.id}', self.name.value)
+                await guild_settings.set(interaction.guild.id, 'del', self.name.value)
             else:
                 await interaction.response.send_message(embed=nextcord.Embed(title=lang['POPUP']['error'], description=lang['POPUP']['error.int'].format(self.name.value), colour=nextcord.Color.red()), ephemeral=True)
         elif interaction.data['components'][0]['components'][0]['custom_id'] == 'rea':
             if self.name.value.isdigit() and 0 <= int(self.name.value) <= 100:
                 await interaction.response.send_message(embed=nextcord.Embed(title=lang['POPUP']['success'], description=lang['POPUP']['success.reaction'].format(self.name.value), colour=nextcord.Color.green()), ephemeral=True)
-                r.set(f'rea:{interaction.guild.id}', self.name.value)
+                await guild_settings.set(interaction.guild.id, 'rea', self.name.value)
             else:
                 await interaction.response.send_message(embed=nextcord.Embed(title=lang['POPUP']['error'], description=lang['POPUP']['error.int'].format(self.name.value), colour=nextcord.Color.red()), ephemeral=True)
 
 
-# code that will add all users to the ranking
-if not r.exists('manner'):
-    keys = r.keys('val:*')
-    for key in keys:
-        print(f'{(r.get(key.replace("val", "msg")))} - {(r.get(key))}')
-        id = key.split(':')[1]
-
-        manner_score = 100 - float(r.get(key)) / float(r.get(key.replace("val", "msg")))
-        print(manner_score)
-        r.zadd('manner', {id: manner_score})
+if __name__ == '__main__':
+    # code that will add all users to the ranking (the launcher does this for its workers)
+    if shards is None and needs_backfill(r):
+        backfill(r, decayed=half_life > 0)
 
-client.run(token)
\ No newline at end of file
+    client.run(token)
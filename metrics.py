@@ -0,0 +1,133 @@
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+
+from aiohttp import web
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def label_text(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(names, values)) + '}'
+
+
+# Counters and histograms are cheap enough to stay on for every message: an
+# update is a lock and a dict lookup. The lock is there because the API is
+# called from the scoring threads.
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        for labels, value in list(self.values.items()):
+            yield f'{self.name}{label_text(self.labels, labels)} {value}'
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self.lock:
+            entry = self.values.get(labels)
+            if entry is None:
+                entry = self.values[labels] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += 1
+            entry[2] += value
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def render(self):
+        names = self.labels + ('le',)
+        for labels, (counts, count, total) in list(self.values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket{label_text(names, labels + (bound,))} {cumulative}'
+            yield f'{self.name}_bucket{label_text(names, labels + ("+Inf",))} {count}'
+            yield f'{self.name}_count{label_text(self.labels, labels)} {count}'
+            yield f'{self.name}_sum{label_text(self.labels, labels)} {total}'
+
+
+api_latency = Histogram('chatkarma_api_seconds', 'Perspective API request latency')
+api_errors = Counter('chatkarma_api_errors_total', 'Perspective API requests that failed')
+api_retries = Counter('chatkarma_api_retries_total', 'Texts scored again after a transient API error')
+breaker_trips = Counter('chatkarma_breaker_trips_total', 'Times the Perspective API circuit opened')
+deferred = Counter('chatkarma_deferred_total', 'Messages that went through the deferred scoring stream',
+                   ('outcome',))
+cache = Counter('chatkarma_cache_total', 'Toxicity cache hits in process and in Redis, misses and LRU evictions',
+                ('result',))
+redis_latency = Histogram('chatkarma_redis_seconds', 'Redis call latency in the message handler', ('op',))
+discord_latency = Histogram('chatkarma_discord_seconds', 'Discord call latency in the message handler', ('action',))
+messages = Counter('chatkarma_messages_total', 'Messages handled per guild and outcome', ('guild', 'outcome'))
+triage = Counter('chatkarma_triage_total', 'Triage outcomes: skipped, commands, passed to the API, shadow scored and agreed',
+                 ('outcome',))
+shed = Counter('chatkarma_shed_total', 'Messages deferred or skipped by the scheduler under overload',
+               ('guild', 'decision'))
+notices_dropped = Counter('chatkarma_notices_dropped_total', 'Deletion notices dropped by the per channel rate limit')
+command_latency = Histogram('chatkarma_command_seconds', 'Application command handler latency', ('command',))
+loop_lag = Histogram('chatkarma_event_loop_lag_seconds', 'How late the event loop wakes up a sleeping task')
+registry = [api_latency, api_errors, api_retries, breaker_trips, deferred, cache, redis_latency, discord_latency,
+            messages, triage, shed, notices_dropped, command_latency, loop_lag]
+
+
+def render():
+    lines = []
+    for metric in registry:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+async def measure_loop_lag(interval=0.5):
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        loop_lag.observe(max(0.0, loop.time() - start - interval))
+
+
+async def handle(request):
+    return web.Response(text=render(), content_type='text/plain', charset='utf-8')
+
+
+# Serves /metrics in the Prometheus text format and starts the loop lag probe.
+async def serve(host='127.0.0.1', port=9100):
+    app = web.Application()
+    app.router.add_get('/metrics', handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    asyncio.get_running_loop().create_task(measure_loop_lag())
+    return runner
@@ -0,0 +1,84 @@
+import configparser
+import time
+
+import redis
+
+from karma import MIGRATE, REBUCKET, decay_key, user_key
+
+
+def used_memory(r):
+    return r.info('memory')['used_memory']
+
+
+# Moves fields that are in a different karma:{n}/decay:{n} hash than
+# user_bucket() puts them in, e.g. after USER_BUCKETS or the bucketing
+# changed. Until then the bot starts those users from the totals it finds
+# in the right hash, and the moved field is added to them.
+def rebucket(r, batch=500, pause=0.01):
+    script = r.register_script(REBUCKET)
+    moved = 0
+    for pattern, key_of in (('karma:*', user_key), ('decay:*', decay_key)):
+        cursor = 0
+        while True:
+            cursor, keys = r.scan(cursor, match=pattern, count=batch)
+            if keys:
+                with r.pipeline(transaction=False) as pipe:
+                    for key in keys:
+                        pipe.hkeys(key)
+                    fields = pipe.execute()
+                with r.pipeline(transaction=False) as pipe:
+                    for key, user_ids in zip(keys, fields):
+                        for user_id in user_ids:
+                            if key_of(user_id) != key:
+                                script(keys=[key, key_of(user_id)], args=[user_id], client=pipe)
+                                moved += 1
+                    pipe.execute()
+            if cursor == 0:
+                break
+            time.sleep(pause)
+    print(f'Moved {moved} users to their hash')
+    return moved
+
+
+# Moves the legacy val:{user}/msg:{user} keys into the compact karma:{n}
+# hashes. Every user is moved by the same script the bot uses, so it is safe
+# to run while the bot keeps recording messages; pause spaces out the batches
+# to leave room for the bot's own traffic.
+def migrate(r, batch=500, pause=0.01):
+    before = used_memory(r)
+    rebucket(r, batch, pause)
+    script = r.register_script(MIGRATE)
+    users = 0
+    cursor = 0
+    start = last_report = time.perf_counter()
+    while True:
+        cursor, keys = r.scan(cursor, match='val:*', count=batch)
+        if keys:
+            with r.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    user_id = key[4:]
+                    script(keys=[user_key(user_id), key, f'msg:{user_id}'], args=[user_id], client=pipe)
+                pipe.execute()
+            users += len(keys)
+
+        now = time.perf_counter()
+        if cursor == 0 or now - last_report >= 1:
+            last_report = now
+            elapsed = now - start
+            print(f'Migrated {users} users in {elapsed:.1f}s ({users / max(elapsed, 1e-9):.0f} users/s)')
+        if cursor == 0:
+            break
+        time.sleep(pause)
+
+    after = used_memory(r)
+    print(f'Memory used: {before / 1048576:.1f}MB before, {after / 1048576:.1f}MB after '
+          f'({(before - after) / 1048576:.1f}MB saved)')
+    return users
+
+
+if __name__ == '__main__':
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    r = redis.Redis(host=config['REDIS']['host'], port=config['REDIS']['port'], password=config['REDIS']['password'],
+                    decode_responses=True, db=config['REDIS']['db'])
+    migrate(r)
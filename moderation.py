@@ -0,0 +1,142 @@
+import asyncio
+
+import metrics
+from scoring import TokenBucket
+
+MAX_EMBEDS = 10
+MAX_EMBED_LENGTH = 6000
+MAX_BULK_DELETE = 100
+
+
+# Buffers log embeds per log channel and sends them together, up to Discord's
+# limits for one message, at most every interval seconds.
+class LogDispatcher:
+    def __init__(self, client, interval=2.0):
+        self.client = client
+        self.interval = interval
+        self.buffers = {}
+        self.timers = {}
+        self.locks = {}
+        self.tasks = set()
+
+    def add(self, channel_id, embed):
+        buffer = self.buffers.setdefault(channel_id, [])
+        if buffer and (len(buffer) >= MAX_EMBEDS or sum(map(len, buffer)) + len(embed) > MAX_EMBED_LENGTH):
+            self.flush(channel_id)
+            buffer = self.buffers.setdefault(channel_id, [])
+        buffer.append(embed)
+        if channel_id not in self.timers:
+            self.timers[channel_id] = asyncio.get_running_loop().call_later(self.interval, self.flush, channel_id)
+
+    def flush(self, channel_id):
+        timer = self.timers.pop(channel_id, None)
+        if timer is not None:
+            timer.cancel()
+        buffer = self.buffers.pop(channel_id, None)
+        if buffer:
+            task = asyncio.get_running_loop().create_task(self.send(channel_id, buffer))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def send(self, channel_id, buffer):
+        # keeps the log in order when a full buffer is flushed before the last one was sent
+        async with self.locks.setdefault(channel_id, asyncio.Lock()):
+            channel = self.client.get_channel(channel_id)
+            if channel is None:
+                return
+            try:
+                with metrics.discord_latency.time('log'):
+                    await channel.send(embeds=buffer)
+            except Exception as e:
+                print(f'Error: Could not send {len(buffer)} log entries to {channel_id} ({e})')
+
+    async def flush_all(self):
+        for channel_id in list(self.buffers):
+            self.flush(channel_id)
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+
+# Deletes flagged messages per channel. A message in a quiet channel is
+# deleted right away; messages flagged while a deletion is in flight are
+# collected and removed with one bulk delete.
+class Deleter:
+    def __init__(self):
+        self.pending = {}
+        self.tasks = set()
+
+    async def delete(self, message):
+        future = asyncio.get_running_loop().create_future()
+        channel = message.channel
+        if channel.id in self.pending:
+            self.pending[channel.id].append((message, future))
+        else:
+            self.pending[channel.id] = [(message, future)]
+            task = asyncio.get_running_loop().create_task(self.drain(channel))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+        await future
+
+    async def drain(self, channel):
+        while self.pending[channel.id]:
+            batch = self.pending[channel.id][:MAX_BULK_DELETE]
+            del self.pending[channel.id][:MAX_BULK_DELETE]
+            try:
+                if len(batch) == 1:
+                    with metrics.discord_latency.time('delete'):
+                        await batch[0][0].delete()
+                    results = [None]
+                else:
+                    with metrics.discord_latency.time('bulk_delete'):
+                        await channel.delete_messages([message for message, future in batch])
+                    results = [None] * len(batch)
+            except Exception as e:
+                if len(batch) == 1:
+                    results = [e]
+                else:
+                    # e.g. one of them was already deleted, fall back to deleting them one by one
+                    results = await asyncio.gather(*(message.delete() for message, future in batch), return_exceptions=True)
+            for (message, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(None)
+        del self.pending[channel.id]
+
+
+# Sends the notices shown to users in the channel in the background with
+# their own per channel rate, so they never hold up deletions. During a raid
+# the notices beyond max_pending for a channel are dropped.
+class Notices:
+    def __init__(self, rate=1.0, burst=3, max_pending=5):
+        self.rate = rate
+        self.burst = burst
+        self.max_pending = max_pending
+        self.buckets = {}
+        self.waiting = {}
+        self.tasks = set()
+
+    def send(self, channel, **kwargs):
+        if self.waiting.get(channel.id, 0) >= self.max_pending:
+            metrics.notices_dropped.inc()
+            return
+        self.waiting[channel.id] = self.waiting.get(channel.id, 0) + 1
+        task = asyncio.get_running_loop().create_task(self.deliver(channel, kwargs))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def deliver(self, channel, kwargs):
+        try:
+            bucket = self.buckets.get(channel.id)
+            if bucket is None:
+                bucket = self.buckets[channel.id] = TokenBucket(self.rate, self.burst)
+            await bucket.acquire()
+            with metrics.discord_latency.time('notice'):
+                await channel.send(**kwargs)
+        except Exception as e:
+            print(f'Error: Could not send a notice to {channel.id} ({e})')
+        finally:
+            self.waiting[channel.id] -= 1
+            if not self.waiting[channel.id]:
+                del self.waiting[channel.id]
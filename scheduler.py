@@ -0,0 +1,94 @@
+import asyncio
+import random
+import time
+from collections import OrderedDict
+
+import metrics
+
+# lower is scored first
+HIGH, NORMAL, LOW, DEFERRED = range(4)
+
+
+# Sits in front of the Scorer and decides, per message, how urgently it has
+# to be scored. While the queued texts fit in max_backlog seconds of this
+# process's share of the quota (see Scorer.backlog) everything is scored.
+# Beyond that high risk messages (new accounts, users with a low manner
+# score, guilds with a strict deletion threshold) still are, normal ones are
+# deferred behind everything else and only sample_rate of the low risk ones
+# (users with a high manner score) are deferred, the rest is skipped.
+# Skipped messages never reach the karma store, so a user's average is taken
+# over a random sample of their messages instead of being skewed by filler
+# values, and the counts are kept in shed:{guild}.
+class Scheduler:
+    def __init__(self, scorer, redis, max_backlog=5.0, sample_rate=0.25, defer_limit=0.5, new_account_days=7,
+                 low_manner=60, trusted_manner=90, strict_delete=50, size=100000):
+        self.scorer = scorer
+        self.redis = redis
+        self.max_backlog = max_backlog
+        self.sample_rate = sample_rate
+        self.defer_limit = defer_limit
+        self.new_account = new_account_days * 86400
+        self.low_manner = low_manner
+        self.trusted_manner = trusted_manner
+        self.strict_delete = strict_delete
+        self.size = size
+        # last manner score seen for each user, so ranking a message costs no round trip
+        self.manners = OrderedDict()
+        self.counts = {'scored': 0, 'deferred': 0, 'skipped': 0}
+
+    def remember(self, user_id, manner):
+        self.manners[user_id] = manner
+        self.manners.move_to_end(user_id)
+        if len(self.manners) > self.size:
+            self.manners.popitem(last=False)
+
+    def priority(self, author, delete_percentage=None):
+        manner = self.manners.get(author.id)
+        if time.time() - author.created_at.timestamp() < self.new_account:
+            return HIGH
+        if manner is not None and manner < self.low_manner:
+            return HIGH
+        if delete_percentage is not None and 0 < int(delete_percentage) <= self.strict_delete:
+            return HIGH
+        if manner is not None and manner >= self.trusted_manner:
+            return LOW
+        return NORMAL
+
+    def overloaded(self):
+        return self.scorer.backlog() > self.max_backlog
+
+    def admit(self, priority):
+        if priority == HIGH or not self.overloaded():
+            return 'scored'
+        # deferred texts may only take part of the queue, the rest stays free for high risk ones
+        if self.scorer.queue.qsize() >= self.scorer.queue_size * self.defer_limit:
+            return 'skipped'
+        if priority == LOW and random.random() >= self.sample_rate:
+            return 'skipped'
+        return 'deferred'
+
+    async def count(self, guild_id, decision):
+        self.counts[decision] += 1
+        if decision == 'scored':
+            return
+        metrics.shed.inc(guild_id, decision)
+        await self.redis.hincrby(f'shed:{guild_id}', decision, 1)
+
+    # returns the API response, or None when the message was skipped or could not be scored
+    async def score(self, text, priority=NORMAL, guild_id=None):
+        decision = self.admit(priority)
+        if decision == 'deferred':
+            try:
+                future = self.scorer.submit(text, DEFERRED)
+            except asyncio.QueueFull:
+                decision = 'skipped'
+            else:
+                await self.count(guild_id, decision)
+                return await future
+        await self.count(guild_id, decision)
+        if decision == 'skipped':
+            return None
+        return await self.scorer.score(text, priority)
+
+    def stats(self):
+        return dict(self.counts)
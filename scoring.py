@@ -0,0 +1,269 @@
+import asyncio
+import itertools
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+
+# Token bucket sized to the Perspective QPS quota
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        while True:
+            self.refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+# Same bucket kept in Redis, so several bot processes share one quota.
+# KEYS: bucket hash
+# ARGV: rate, capacity, amount
+TAKE = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local amount = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= amount then
+    tokens = tokens - amount
+else
+    wait = (amount - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+return tostring(wait)
+"""
+
+
+class RedisTokenBucket:
+    def __init__(self, redis, rate, capacity, key='quota:perspective'):
+        self.rate = rate
+        self.capacity = capacity
+        self.key = key
+        self.take = redis.register_script(TAKE)
+
+    async def acquire(self, amount=1):
+        while True:
+            wait = float(await self.take(keys=[self.key], args=[self.rate, self.capacity, amount]))
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+
+# Raised instead of a result when the API is down: the circuit is open or
+# the retries of a transient error ran out.
+class Unavailable(Exception):
+    pass
+
+
+# Stops calling the API after threshold consecutive failed calls. After
+# reset seconds one call is let through as a probe; it closes the circuit
+# when it succeeds and keeps it open for another reset seconds when it fails.
+class CircuitBreaker:
+    def __init__(self, threshold=5, reset=30):
+        self.threshold = threshold
+        self.reset = reset
+        self.failures = 0
+        self.opened = None
+        self.probing = False
+
+    @property
+    def state(self):
+        if self.opened is None:
+            return 'closed'
+        if time.monotonic() - self.opened < self.reset:
+            return 'open'
+        return 'half-open'
+
+    def allow(self):
+        state = self.state
+        if state == 'closed':
+            return True
+        if state == 'half-open' and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    # the probe ended before it reached the API, so it says nothing; the next call probes instead
+    def abandon(self):
+        self.probing = False
+
+    def success(self):
+        self.failures = 0
+        self.opened = None
+        self.probing = False
+
+    def failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.opened is not None or self.failures >= self.threshold:
+            if self.opened is None:
+                metrics.breaker_trips.inc()
+            self.opened = time.monotonic()
+
+
+# Scoring stage that keeps the blocking API client off the event loop.
+# Callers await score(); when the queue is full they wait (backpressure)
+# instead of piling up more requests than the quota can serve. Texts with a
+# lower priority number are scored first, in arrival order within a priority.
+# With batch_func and batch_size > 1, texts arriving within batch_window
+# seconds of each other are scored together in one call.
+# func raises on errors and batch_func returns the exception in place of a
+# result. Errors transient() accepts are retried up to retries times with
+# jittered exponential backoff and count towards the breaker; if they keep
+# failing, or the breaker is open, the caller gets Unavailable. Any other
+# error (e.g. an unsupported language) scores the text as None.
+class Scorer:
+    def __init__(self, func, workers=4, queue_size=256, rate=1, burst=1,
+                 batch_func=None, batch_size=1, batch_window=0.005, bucket=None,
+                 retries=2, backoff=0.5, breaker=None, transient=None, share=1.0):
+        self.func = func
+        self.batch_func = batch_func
+        self.batch_size = batch_size if batch_func is not None else 1
+        self.batch_window = batch_window
+        self.workers = workers
+        self.queue_size = queue_size
+        # a whole batch is paid for at once, so the bucket has to be able to hold one
+        self.bucket = bucket or TokenBucket(rate, max(burst, self.batch_size))
+        # part of the bucket's rate this process gets when it is shared with others
+        self.share = share
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.transient = transient or (lambda error: True)
+        self.queue = None
+        self.executor = None
+        self.tasks = []
+        self.counter = itertools.count()
+
+    def start(self):
+        if self.tasks:
+            return
+        loop = asyncio.get_running_loop()
+        self.queue = asyncio.PriorityQueue(maxsize=self.queue_size)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='scorer')
+        self.tasks = [loop.create_task(self.worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        self.executor.shutdown(wait=False)
+
+    async def score(self, text, priority=0):
+        if self.breaker.state == 'open':
+            raise Unavailable('Perspective API circuit is open')
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((priority, next(self.counter), text, future))
+        return await future
+
+    # queues text without waiting for room, raises asyncio.QueueFull instead
+    def submit(self, text, priority=0):
+        if self.breaker.state == 'open':
+            raise Unavailable('Perspective API circuit is open')
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((priority, next(self.counter), text, future))
+        return future
+
+    # seconds the queued texts will take to go through this process's share of
+    # the quota; with a bucket shared through Redis the others use the rest
+    def backlog(self):
+        if self.queue is None:
+            return 0.0
+        return self.queue.qsize() / (self.bucket.rate * self.share)
+
+    async def collect(self):
+        batch = [await self.queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.batch_window
+        while len(batch) < self.batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def call(self, texts):
+        loop = asyncio.get_running_loop()
+        try:
+            if len(texts) == 1:
+                return [await loop.run_in_executor(self.executor, self.func, texts[0])]
+            return await loop.run_in_executor(self.executor, self.batch_func, texts)
+        except Exception as e:
+            return [e] * len(texts)
+
+    async def run(self, batch):
+        error = None
+        for attempt in range(self.retries + 1):
+            if not self.breaker.allow():
+                error = Unavailable('Perspective API circuit is open')
+                break
+            try:
+                await self.bucket.acquire(len(batch))
+                results = await self.call([text for text, future in batch])
+            except BaseException:
+                # e.g. a Redis error from the shared bucket, or stop()
+                self.breaker.abandon()
+                raise
+            retry = []
+            for (text, future), result in zip(batch, results):
+                if isinstance(result, Exception) and self.transient(result):
+                    retry.append((text, future))
+                    error = result
+                elif not future.done():
+                    future.set_result(None if isinstance(result, Exception) else result)
+            # a few throttled texts in a batch that otherwise went through is not an outage
+            if len(retry) < len(batch):
+                self.breaker.success()
+            else:
+                self.breaker.failure()
+            batch = retry
+            if not batch:
+                return
+            if attempt < self.retries:
+                metrics.api_retries.inc(amount=len(batch))
+                await asyncio.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+        for text, future in batch:
+            if not future.done():
+                future.set_exception(error if isinstance(error, Unavailable) else Unavailable(str(error)))
+
+    async def worker(self):
+        while True:
+            items = await self.collect() if self.batch_size > 1 else [await self.queue.get()]
+            try:
+                batch = [(text, future) for priority, order, text, future in items if not future.cancelled()]
+                if batch:
+                    await self.run(batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                for priority, order, text, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+            finally:
+                for _ in items:
+                    self.queue.task_done()
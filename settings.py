@@ -0,0 +1,58 @@
+import asyncio
+
+
+# In-process cache of the per guild thresholds (del:, rea:, log:).
+# Writes go through set(), which publishes the guild id so every process
+# drops its cached copy instead of polling Redis on each message.
+class GuildSettings:
+    def __init__(self, redis, channel='settings'):
+        self.redis = redis
+        self.channel = channel
+        self.entries = {}
+        self.generation = 0
+        self.task = None
+
+    async def get(self, guild_id):
+        guild_id = str(guild_id)
+        settings = self.entries.get(guild_id)
+        if settings is None:
+            generation = self.generation
+            settings = tuple(await self.redis.mget(f'del:{guild_id}', f'rea:{guild_id}', f'log:{guild_id}'))
+            # an invalidation arrived while we were reading, don't cache what may be stale
+            if generation == self.generation:
+                self.entries[guild_id] = settings
+        return settings
+
+    async def set(self, guild_id, field, value):
+        guild_id = str(guild_id)
+        await self.redis.set(f'{field}:{guild_id}', value)
+        self.invalidate(guild_id)
+        await self.redis.publish(self.channel, guild_id)
+
+    def invalidate(self, guild_id=None):
+        self.generation += 1
+        if guild_id is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(guild_id, None)
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self.listen())
+
+    async def listen(self):
+        while True:
+            try:
+                async with self.redis.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    # anything may have changed while we were not subscribed
+                    self.invalidate()
+                    async for message in pubsub.listen():
+                        if message['type'] == 'message':
+                            self.invalidate(message['data'])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f'Error: Lost guild settings subscription ({e}), retrying...')
+                self.invalidate()
+                await asyncio.sleep(1)
@@ -0,0 +1,149 @@
+import json
+import math
+import random
+import re
+import sys
+import zlib
+
+import metrics
+from cache import normalize
+
+URL = re.compile(r'https?://\S+')
+MARKUP = re.compile(r'<a?:\w+:\d+>|<[@#&!]{1,2}\d+>')
+
+
+# Cheap checks for messages that never need the API: emoji and punctuation
+# only, bare links and numbers. Empty text (attachments, stickers) gets no
+# estimate; it has nothing to score and no karma.
+# Other bots' commands are only recognized by their exact configured names
+# (e.g. "!help"), anything else that merely starts with a prefix is text.
+class Heuristics:
+    def __init__(self, score=1.0, commands=()):
+        self.score = score
+        self.commands = frozenset(command.casefold() for command in commands)
+
+    def command(self, text):
+        return text.strip().casefold() in self.commands
+
+    def __call__(self, text):
+        stripped = text.strip()
+        if not stripped:
+            return None
+        rest = MARKUP.sub('', URL.sub('', stripped))
+        if not any(char.isalpha() for char in rest):
+            return self.score
+        return None
+
+
+def features(text, dim):
+    text = normalize(text)
+    padded = f' {text} '
+    grams = [padded[i:i + 3] for i in range(len(padded) - 2)]
+    grams += [f'w:{word}' for word in text.split()]
+    return [zlib.crc32(gram.encode()) % dim for gram in grams]
+
+
+# Logistic regression over hashed character trigrams and words, trained on
+# Perspective scores (as soft labels), so predict() estimates the toxicity.
+class Classifier:
+    def __init__(self, dim=1 << 18, bias=0.0, weights=None):
+        self.dim = dim
+        self.bias = bias
+        self.weights = weights or {}
+
+    def predict(self, text):
+        x = features(text, self.dim)
+        if not x:
+            return 0.0
+        z = self.bias + sum(self.weights.get(i, 0.0) for i in x) / math.sqrt(len(x))
+        return 100 / (1 + math.exp(-max(min(z, 30), -30)))
+
+    def train(self, samples, epochs=5, rate=0.5):
+        samples = list(samples)
+        for epoch in range(epochs):
+            random.shuffle(samples)
+            for text, toxicity in samples:
+                x = features(text, self.dim)
+                if not x:
+                    continue
+                scale = 1 / math.sqrt(len(x))
+                gradient = (self.predict(text) - toxicity) / 100
+                self.bias -= rate * gradient
+                for i in x:
+                    self.weights[i] = self.weights.get(i, 0.0) - rate * gradient * scale
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({'dim': self.dim, 'bias': self.bias,
+                       'weights': {str(i): round(w, 5) for i, w in self.weights.items() if abs(w) > 1e-4}}, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            model = json.load(f)
+        return cls(model['dim'], model['bias'], {int(i): w for i, w in model['weights'].items()})
+
+
+# Runs the local stages before the API. check() returns an estimated
+# evaluation for definitely benign messages, or None when the message must
+# be scored. A sample of the benign ones is scored anyway (shadow mode) to
+# measure how often the triage agrees with Perspective.
+class Triage:
+    def __init__(self, heuristics=None, classifier=None, benign_below=10, shadow_rate=0.0):
+        self.heuristics = heuristics
+        self.classifier = classifier
+        self.benign_below = benign_below
+        self.shadow_rate = shadow_rate
+        self.skipped = 0
+        self.passed = 0
+        self.shadowed = 0
+        self.agreed = 0
+
+    # None when the text needs the API; a command gets a toxicity of None, so it is not recorded
+    def check(self, text):
+        if self.heuristics is not None and self.heuristics.command(text):
+            metrics.triage.inc('command')
+            return {'toxicity': None, 'language': ['und'], 'triaged': True}
+        estimate = None
+        if self.heuristics is not None:
+            estimate = self.heuristics(text)
+        if estimate is None and self.classifier is not None:
+            prediction = self.classifier.predict(text)
+            if prediction < self.benign_below:
+                estimate = prediction
+        if estimate is None:
+            self.passed += 1
+            metrics.triage.inc('passed')
+            return None
+        self.skipped += 1
+        metrics.triage.inc('skipped')
+        return {'toxicity': round(estimate, 2), 'language': ['und'], 'triaged': True}
+
+    def shadow(self):
+        return random.random() < self.shadow_rate
+
+    def record(self, scored):
+        self.shadowed += 1
+        metrics.triage.inc('shadowed')
+        if scored['toxicity'] < self.benign_below:
+            self.agreed += 1
+            metrics.triage.inc('agreed')
+
+    def stats(self):
+        return {'skipped': self.skipped, 'passed': self.passed, 'shadowed': self.shadowed,
+                'agreement': self.agreed / self.shadowed if self.shadowed else None}
+
+
+# python triage.py train <samples.tsv> [model]
+# Each line of the samples file is "<toxicity 0-100>\t<message text>".
+if __name__ == '__main__':
+    if len(sys.argv) < 3 or sys.argv[1] != 'train':
+        print('Usage: python triage.py train <samples.tsv> [model]')
+        sys.exit(1)
+    path = sys.argv[3] if len(sys.argv) > 3 else 'triage.model'
+    with open(sys.argv[2], encoding='utf-8') as f:
+        samples = [(text, float(score)) for score, text in (line.rstrip('\n').split('\t', 1) for line in f if '\t' in line)]
+    classifier = Classifier()
+    classifier.train(samples)
+    classifier.save(path)
+    print(f'Trained on {len(samples)} samples, saved to {path}.')